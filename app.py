@@ -21,7 +21,6 @@ import websocket
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-from services.supabase_client import SupabaseClient
 from services.tasks import process_whatsapp_job
 from services.openai_client import OpenAIClient
 from services.call_service import CallService
@@ -32,7 +31,6 @@ app = Flask(__name__)
 sock = Sock(app)
 
 # Initialize services
-supabase_client = SupabaseClient()
 twilio_client = TwilioClient(os.getenv("TWILIO_ACCOUNT_SID"), os.getenv("TWILIO_AUTH_TOKEN"))
 openai_client = OpenAIClient()
 call_service = CallService(twilio_client=twilio_client, openai_client=openai_client)
@@ -119,33 +117,33 @@ def health_check():
 def webhook():
     """Twilio WhatsApp webhook handler"""
     try:
+        form = request.form
         # Get incoming message data
-        incoming_message = request.form.get("Body", "")
-        logger.info(f"[webhook] incoming message body='{incoming_message[:120]}'")
-        # Twilio sends media as MediaUrl0, MediaUrl1, etc. and MediaContentType0 for the first.
-        media_urls = [
-            url
-            for url in [
-                request.form.get("MediaUrl0"),
-                request.form.get("MediaUrl1"),
-                request.form.get("MediaUrl2"),
-            ]
-            if url
-        ]
-        media_content_type0 = (request.form.get("MediaContentType0") or "").strip().lower()
+        incoming_message = form.get("Body", "")
+        # Twilio sends NumMedia plus MediaUrl0..N-1; only probe the indices that exist (0 for plain text).
+        try:
+            num_media = int(form.get("NumMedia") or 0)
+        except ValueError:
+            num_media = 0
+        media_urls = [url for url in (form.get(f"MediaUrl{i}") for i in range(num_media)) if url]
+        media_content_type0 = (form.get("MediaContentType0") or "").strip().lower() if media_urls else ""
         # Twilio sends Latitude, Longitude, Address, Label for shared location
-        latitude = request.form.get("Latitude", "").strip()
-        longitude = request.form.get("Longitude", "").strip()
-        address = (request.form.get("Address") or "").strip()
-        label = (request.form.get("Label") or "").strip()
+        latitude = form.get("Latitude", "").strip()
+        longitude = form.get("Longitude", "").strip()
+        address = (form.get("Address") or "").strip()
+        label = (form.get("Label") or "").strip()
         has_location = latitude and longitude
+        from_number = form.get("From", "")
+        message_sid = form.get("MessageSid", "")
         logger.info(
-            f"[webhook] media_count={len(media_urls)} media_type={media_content_type0} location=({latitude},{longitude})"
+            "[webhook] from=%s message_sid=%s media_count=%d media_type=%s location=(%s,%s)",
+            from_number,
+            message_sid,
+            len(media_urls),
+            media_content_type0,
+            latitude,
+            longitude,
         )
-        from_number = request.form.get("From", "")
-        logger.info(f"[webhook] from={from_number}")
-        message_sid = request.form.get("MessageSid", "")
-        logger.info(f"[webhook] message_sid={message_sid}")
 
         # Create Twilio response
         resp = MessagingResponse()
@@ -175,13 +173,12 @@ def webhook():
             resp.message("Please send an image, PDF, voice note, location, or text message.")
             return str(resp), 200
 
-        # Persist the incoming message immediately
+        # Enqueue Celery task; the worker persists the message + job, so the webhook
+        # only pays for the broker publish before Twilio gets its response.
         try:
-            supabase_client.save_message(
+            process_whatsapp_job.delay(
                 {
                     "phone_number": from_number,
-                    "direction": "in",
-                    "role": "user",
                     "message_sid": message_sid,
                     "content": incoming_message
                     or (
@@ -194,24 +191,10 @@ def webhook():
                         if media_urls
                         else ({"latitude": latitude, "longitude": longitude} if has_location else {})
                     ),
+                    "job_type": job_type,
+                    "payload": payload,
                 }
             )
-        except Exception as e:
-            logger.error(f"Failed to save incoming message: {e}", exc_info=True)
-
-        # Create job in DB
-        job = supabase_client.create_job(
-            {
-                "phone_number": from_number,
-                "message_sid": message_sid,
-                "job_type": job_type,
-                "payload": payload,
-            }
-        )
-
-        # Enqueue Celery task
-        try:
-            process_whatsapp_job.delay(str(job.get("id")))
             # resp.message("✅ Got your message. I'm processing it in the background and will reply shortly.")
         except Exception as e:
             logger.error(f"Failed to enqueue background job: {e}", exc_info=True)
@@ -111,6 +111,8 @@ CREATE TABLE IF NOT EXISTS wbot_jobs (
 CREATE INDEX IF NOT EXISTS idx_wbot_jobs_phone_number ON wbot_jobs(phone_number);
 CREATE INDEX IF NOT EXISTS idx_wbot_jobs_created_at ON wbot_jobs(created_at DESC);
 CREATE INDEX IF NOT EXISTS idx_wbot_jobs_status ON wbot_jobs(status);
+-- One job per Twilio message, so webhook retries don't double-process.
+CREATE UNIQUE INDEX IF NOT EXISTS idx_wbot_jobs_message_sid ON wbot_jobs(message_sid) WHERE message_sid IS NOT NULL;
 
 ALTER TABLE wbot_jobs ENABLE ROW LEVEL SECURITY;
 
@@ -118,3 +120,143 @@ CREATE POLICY "wbot_allow_all_operations_jobs" ON wbot_jobs
     FOR ALL
     USING (true)
     WITH CHECK (true);
+
+-- Content-addressable cache of OCR results, keyed by sha256(prompt_version|model|file bytes).
+CREATE TABLE IF NOT EXISTS wbot_ocr_cache (
+    hash TEXT PRIMARY KEY,
+    text TEXT NOT NULL,
+    model TEXT NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+ALTER TABLE wbot_ocr_cache ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "wbot_allow_all_operations_ocr_cache" ON wbot_ocr_cache
+    FOR ALL
+    USING (true)
+    WITH CHECK (true);
+
+-- Cache of OpenAI embeddings shared across workers, keyed by sha256(model \0 text).
+-- `vector` holds base64-encoded float32 bytes (~4x smaller than JSON floats).
+CREATE TABLE IF NOT EXISTS wbot_embedding_cache (
+    hash TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    vector TEXT NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+ALTER TABLE wbot_embedding_cache ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "wbot_allow_all_operations_embedding_cache" ON wbot_embedding_cache
+    FOR ALL
+    USING (true)
+    WITH CHECK (true);
+
+-- RPC: Persist an incoming message and create its job in one transaction (one round-trip).
+-- Called by the Celery task itself (the webhook only publishes to the broker), so a job row never
+-- exists before its task is queued and no insert trigger / pg_notify bridge is needed.
+-- Idempotent on message_sid: a retried delivery returns the existing job and doesn't re-save the message.
+-- Usage from Supabase client: rpc('wbot_webhook_ingest', {...})
+CREATE OR REPLACE FUNCTION wbot_webhook_ingest(
+    p_phone_number text,
+    p_message_sid text,
+    p_content text,
+    p_metadata jsonb,
+    p_job_type text,
+    p_payload jsonb
+)
+RETURNS wbot_jobs
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_job wbot_jobs;
+BEGIN
+    -- `has_history` lets the worker skip the conversation-history read for first-time senders
+    INSERT INTO wbot_jobs (phone_number, message_sid, job_type, payload)
+    VALUES (
+        p_phone_number,
+        NULLIF(p_message_sid, ''),
+        p_job_type,
+        COALESCE(p_payload, '{}'::jsonb) || jsonb_build_object(
+            'has_history', EXISTS (SELECT 1 FROM wbot_messages WHERE phone_number = p_phone_number)
+        )
+    )
+    ON CONFLICT (message_sid) WHERE message_sid IS NOT NULL DO NOTHING
+    RETURNING * INTO v_job;
+
+    IF NOT FOUND THEN
+        SELECT * INTO v_job FROM wbot_jobs WHERE message_sid = p_message_sid;
+        RETURN v_job;
+    END IF;
+
+    INSERT INTO wbot_messages (phone_number, direction, role, message_sid, content, metadata)
+    VALUES (p_phone_number, 'in', 'user', p_message_sid, p_content, COALESCE(p_metadata, '{}'::jsonb));
+
+    RETURN v_job;
+END;
+$$;
+
+-- RPC: Atomically claim a queued job for processing; returns no row if another worker already has it.
+-- A `processing` job whose lease (`p_lease_seconds` since its last update) has run out is claimable again,
+-- so a task redelivered after a worker crash picks the job back up instead of leaving it stuck.
+-- Usage from Supabase client: rpc('wbot_claim_job', {'p_id': ..., 'p_lease_seconds': ...})
+DROP FUNCTION IF EXISTS wbot_claim_job(uuid);
+CREATE OR REPLACE FUNCTION wbot_claim_job(p_id uuid, p_lease_seconds integer DEFAULT 600)
+RETURNS SETOF wbot_jobs
+LANGUAGE sql
+AS $$
+    UPDATE wbot_jobs
+    SET status = 'processing', updated_at = NOW()
+    WHERE id = p_id
+      AND (
+        status = 'queued'
+        OR (status = 'processing' AND updated_at < NOW() - make_interval(secs => p_lease_seconds))
+      )
+    RETURNING *;
+$$;
+
+-- RPC: Mark a job completed and save its outgoing message in one transaction (one round-trip).
+-- `p_message` is a wbot_messages-shaped object (phone_number, direction, role, message_sid, content, metadata).
+-- Usage from Supabase client: rpc('wbot_finish_job', {...})
+CREATE OR REPLACE FUNCTION wbot_finish_job(
+    p_job_id uuid,
+    p_result jsonb,
+    p_message jsonb
+)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE wbot_jobs
+    SET status = 'completed', result = p_result, updated_at = NOW()
+    WHERE id = p_job_id;
+
+    IF p_message IS NOT NULL THEN
+        INSERT INTO wbot_messages (phone_number, direction, role, message_sid, content, metadata)
+        VALUES (
+            p_message->>'phone_number',
+            COALESCE(p_message->>'direction', 'out'),
+            COALESCE(p_message->>'role', 'assistant'),
+            p_message->>'message_sid',
+            p_message->>'content',
+            COALESCE(p_message->'metadata', '{}'::jsonb)
+        );
+    END IF;
+END;
+$$;
+
+-- RPC: Mark a job failed. Mirrors wbot_finish_job so both terminal transitions stamp updated_at server-side.
+-- Usage from Supabase client: rpc('wbot_fail_job', {...})
+CREATE OR REPLACE FUNCTION wbot_fail_job(
+    p_job_id uuid,
+    p_error text
+)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE wbot_jobs
+    SET status = 'failed', error = p_error, updated_at = NOW()
+    WHERE id = p_job_id;
+END;
+$$;
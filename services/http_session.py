@@ -0,0 +1,33 @@
+"""
+Shared pooled HTTP session factory for outbound `requests` calls.
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Upstream statuses worth retrying (rate limits and server-side failures).
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def build_session(pool_connections: int = 10, pool_maxsize: int = 20) -> requests.Session:
+    """
+    Build a `requests.Session` with keep-alive connection pooling and retries on
+    transient upstream errors, so repeated calls to the same host reuse sockets.
+    """
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.3, status_forcelist=RETRY_STATUSES)
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def is_transient_error(e: BaseException) -> bool:
+    """True for `requests` failures a later retry may fix: connection errors, timeouts, 429/5xx."""
+    # RetryError: the session's own status retries ran out on a RETRY_STATUSES response
+    if isinstance(e, (requests.ConnectionError, requests.Timeout, requests.exceptions.RetryError)):
+        return True
+    if isinstance(e, requests.HTTPError):
+        return e.response is not None and e.response.status_code in RETRY_STATUSES
+    return False
@@ -3,66 +3,121 @@ Mistral OCR service (generic) for extracting text from images/PDFs.
 """
 
 import os
+import logging
 import requests
-from typing import Dict, Any, Optional
+from typing import Optional
 import base64
+import hashlib
 from io import BytesIO
+from urllib.parse import urlparse
+
+import orjson
+
+from services.http_session import build_session
+
+logger = logging.getLogger(__name__)
+
+
+# Bump when the OCR prompt changes so stale cached results are not reused.
+PROMPT_VERSION = "v1"
+
+# PDF render resolution; ~150 DPI is enough for the vision model and keeps the JPEG small.
+PDF_RENDER_DPI = 150
 
 
 class MistralOCR:
     """Handles OCR operations using Mistral API"""
 
-    def __init__(self):
+    def __init__(self, supabase_client=None):
         self.api_key = os.getenv("MISTRAL_API_KEY")
         self.model = os.getenv("MISTRAL_MODEL", "pixtral-12b-2409")
         self.api_url = "https://api.mistral.ai/v1/chat/completions"
+        # Optional content-addressable result cache (Supabase `wbot_ocr_cache`); MISTRAL_OCR_CACHE=0 disables it.
+        self.supabase = supabase_client
+        self.cache_enabled = supabase_client is not None and os.getenv("MISTRAL_OCR_CACHE", "1") != "0"
 
         if not self.api_key:
             raise ValueError("MISTRAL_API_KEY must be set in environment variables")
 
-    def extract_text(self, file_url: str, content_type: Optional[str] = None) -> str:
+        # Pooled keep-alive session; auth headers are sent per-request so the
+        # Mistral key never leaks to the storage hosts we download files from.
+        self._session = build_session()
+        self._headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+
+    def close(self) -> None:
+        """Release pooled HTTP connections."""
+        self._session.close()
+
+    def _cache_key(self, file_data: bytes) -> str:
+        return hashlib.sha256(f"{PROMPT_VERSION}|{self.model}|".encode() + file_data).hexdigest()
+
+    def _cache_get(self, key: str) -> Optional[str]:
+        if not self.cache_enabled:
+            return None
+        try:
+            return self.supabase.get_ocr_cache(key)
+        except Exception as e:
+            logger.warning("[MistralOCR] cache lookup failed: %s", e)
+            return None
+
+    def _cache_put(self, key: str, text: str) -> None:
+        if not self.cache_enabled:
+            return
+        try:
+            self.supabase.save_ocr_cache(key, text, self.model)
+        except Exception as e:
+            logger.warning("[MistralOCR] cache write failed: %s", e)
+
+    @staticmethod
+    def _is_fetchable_url(file_url: str) -> bool:
+        """
+        True if Mistral can fetch the URL itself (public/signed http(s) URL, not a Twilio media URL,
+        which needs account credentials).
+        """
+        parsed = urlparse(file_url or "")
+        host = (parsed.hostname or "").lower()
+        return parsed.scheme in ("http", "https") and not (host == "twilio.com" or host.endswith(".twilio.com"))
+
+    def extract_text(
+        self, file_url: str, content_type: Optional[str] = None, file_data: Optional[bytes] = None
+    ) -> str:
         """
         Extract raw text from image/PDF using Mistral vision model.
 
+        Images at a fetchable URL are passed to Mistral by URL; only PDFs (which must be
+        rasterized) and non-fetchable URLs are downloaded and sent inline as base64.
+
         Args:
             file_url: URL of the image or PDF
             content_type: MIME type of the file (optional)
+            file_data: File bytes if the caller already has them (optional; avoids a download
+                and enables the OCR cache for URL-passed images)
 
         Returns:
             Extracted text
         """
-        # Download file
-        response = requests.get(file_url)
-        response.raise_for_status()
-        file_data = response.content
-
-        # Handle PDF files - convert first page to image
-        if content_type == "application/pdf" or file_url.lower().endswith(".pdf"):
-            try:
-                # Try to use pdf2image if available
-                try:
-                    from pdf2image import convert_from_bytes
-
-                    images = convert_from_bytes(file_data, first_page=1, last_page=1)
-                    if images:
-                        img_byte_arr = BytesIO()
-                        images[0].save(img_byte_arr, format="JPEG")
-                        file_data = img_byte_arr.getvalue()
-                        content_type = "image/jpeg"
-                except ImportError:
-                    raise Exception("PDF support requires pdf2image library. Install with: pip install pdf2image")
-            except Exception as e:
-                raise Exception(f"Failed to process PDF: {str(e)}")
+        is_pdf = content_type == "application/pdf" or file_url.lower().endswith(".pdf")
+        is_image = (content_type or "image/jpeg").startswith("image/")
+        send_by_url = not is_pdf and is_image and self._is_fetchable_url(file_url)
 
-        # Convert to base64
-        image_base64 = base64.b64encode(file_data).decode("utf-8")
-
-        # Determine MIME type for API
-        mime_type = content_type or "image/jpeg"
-        if mime_type.startswith("image/"):
-            data_url_prefix = f"data:{mime_type};base64,"
+        # Download file only when we need the bytes
+        if file_data is None and not send_by_url:
+            response = self._session.get(file_url, timeout=30)
+            response.raise_for_status()
+            file_data = response.content
+
+        # Resent/forwarded files are common; skip the vision call if we've seen these exact bytes.
+        # PDFs are keyed on the original bytes, not the rasterized page.
+        cache_key = self._cache_key(file_data) if file_data is not None else None
+        if cache_key:
+            cached = self._cache_get(cache_key)
+            if cached is not None:
+                return cached
+
+        if send_by_url:
+            image_url = file_url
         else:
-            data_url_prefix = "data:image/jpeg;base64,"
+            image_url = self._to_data_url(file_data, content_type, is_pdf)
 
         prompt = (
             "Extract ALL visible text from this image. Preserve line breaks where helpful. "
@@ -70,8 +125,6 @@ class MistralOCR:
         )
 
         # Call Mistral API
-        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
-
         payload = {
             "model": self.model,
             "messages": [
@@ -79,7 +132,7 @@ class MistralOCR:
                     "role": "user",
                     "content": [
                         {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": f"{data_url_prefix}{image_base64}"}},
+                        {"type": "image_url", "image_url": {"url": image_url}},
                     ],
                 }
             ],
@@ -88,14 +141,77 @@ class MistralOCR:
         }
 
         try:
-            response = requests.post(self.api_url, json=payload, headers=headers, timeout=30)
+            # orjson serializes the (possibly multi-MB) body straight to bytes
+            response = self._session.post(
+                self.api_url, data=orjson.dumps(payload), headers=self._headers, timeout=30
+            )
             response.raise_for_status()
 
             result = response.json()
             content = result["choices"][0]["message"]["content"]
-            return (content or "").strip()
+            text = (content or "").strip()
+            if cache_key:
+                self._cache_put(cache_key, text)
+            return text
 
         except requests.exceptions.RequestException as e:
-            raise Exception(f"Mistral API error: {str(e)}")
+            # Re-raise as-is so the task can tell transient failures apart and retry
+            logger.debug("[MistralOCR] Mistral API error: %s", e)
+            raise
         except (KeyError, IndexError) as e:
             raise Exception(f"Unexpected API response format: {str(e)}")
+
+    def _to_data_url(self, file_data: bytes, content_type: Optional[str], is_pdf: bool) -> str:
+        """
+        Build a base64 data URL for inline upload, rasterizing the first page of PDFs.
+        """
+        # Handle PDF files - convert first page to image
+        if is_pdf:
+            try:
+                file_data = self._render_pdf_first_page(file_data)
+                content_type = "image/jpeg"
+            except Exception as e:
+                raise Exception(f"Failed to process PDF: {str(e)}")
+
+        # Determine MIME type for API
+        mime_type = content_type or "image/jpeg"
+        if mime_type.startswith("image/"):
+            data_url_prefix = f"data:{mime_type};base64,"
+        else:
+            data_url_prefix = "data:image/jpeg;base64,"
+
+        # Encode on bytes and decode once, avoiding extra multi-MB str copies
+        return (data_url_prefix.encode("ascii") + base64.b64encode(file_data)).decode("ascii")
+
+    @staticmethod
+    def _render_pdf_first_page(pdf_data: bytes) -> bytes:
+        """
+        Rasterize the first PDF page to JPEG bytes.
+
+        Uses pypdfium2 (in-process, no subprocess or temp files); falls back to pdf2image/poppler.
+        """
+        img_byte_arr = BytesIO()
+        try:
+            import pypdfium2 as pdfium
+        except ImportError:
+            pdfium = None
+
+        if pdfium is not None:
+            pdf = pdfium.PdfDocument(pdf_data)
+            try:
+                page = pdf[0]
+                page.render(scale=PDF_RENDER_DPI / 72).to_pil().convert("RGB").save(img_byte_arr, format="JPEG")
+            finally:
+                pdf.close()
+            return img_byte_arr.getvalue()
+
+        try:
+            from pdf2image import convert_from_bytes
+        except ImportError:
+            raise Exception("PDF support requires pypdfium2 (or pdf2image). Install with: pip install pypdfium2")
+
+        images = convert_from_bytes(pdf_data, dpi=PDF_RENDER_DPI, first_page=1, last_page=1)
+        if not images:
+            raise Exception("PDF has no pages")
+        images[0].save(img_byte_arr, format="JPEG")
+        return img_byte_arr.getvalue()
@@ -4,20 +4,81 @@ OpenAI client using the official `openai` package for embeddings, chat (with too
 
 import io
 import base64
-import json
+import hashlib
+import logging
 import os
+import threading
+from array import array
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, Iterable, List, Optional
 
-from openai import OpenAI
+import httpx
+import orjson
+from openai import DefaultHttpxClient, OpenAI
+
+logger = logging.getLogger(__name__)
+
+# In-process embedding cache shared by all clients in this process: sha256(model, text) -> float32 vector.
+# float32 arrays keep 10k x 1536-dim vectors at ~60MB (boxed Python floats would be ~8x that).
+_EMBEDDING_CACHE_MAXSIZE = 10000
+_embedding_cache: "OrderedDict[str, array]" = OrderedDict()
+_embedding_cache_lock = threading.Lock()
+_embedding_cache_stats = {"hits": 0, "misses": 0}
+# Write-backs to the persistent (Supabase) embedding cache run here, off the request path.
+_embedding_persist_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="embedding-cache")
+
+# Mirrors functools.lru_cache's cache_info() shape.
+EmbeddingCacheInfo = namedtuple("EmbeddingCacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+def _embedding_cache_get(key: str) -> Optional[array]:
+    with _embedding_cache_lock:
+        vec = _embedding_cache.get(key)
+        if vec is not None:
+            _embedding_cache.move_to_end(key)
+            _embedding_cache_stats["hits"] += 1
+        else:
+            _embedding_cache_stats["misses"] += 1
+        return vec
+
+
+def _embedding_cache_put(key: str, vec: array) -> None:
+    with _embedding_cache_lock:
+        _embedding_cache[key] = vec
+        _embedding_cache.move_to_end(key)
+        while len(_embedding_cache) > _EMBEDDING_CACHE_MAXSIZE:
+            _embedding_cache.popitem(last=False)
+
+
+def embedding_cache_info() -> EmbeddingCacheInfo:
+    """Hit/miss counters and size of the in-process embedding cache."""
+    with _embedding_cache_lock:
+        return EmbeddingCacheInfo(
+            _embedding_cache_stats["hits"],
+            _embedding_cache_stats["misses"],
+            _EMBEDDING_CACHE_MAXSIZE,
+            len(_embedding_cache),
+        )
 
 
 class OpenAIClient:
-    def __init__(self):
+    def __init__(self, supabase_client=None):
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError("OPENAI_API_KEY must be set in environment variables")
+        # Optional persistent embedding cache (Supabase `wbot_embedding_cache`) shared across workers.
+        self.supabase = supabase_client
 
-        self.client = OpenAI(api_key=api_key, base_url=os.getenv("OPENAI_BASE_URL") or None)
+        # HTTP/2 multiplexes concurrent embedding/chat requests (agent tool loops, parallel workers)
+        # over one TLS connection instead of one socket per in-flight request.
+        self.client = OpenAI(
+            api_key=api_key,
+            base_url=os.getenv("OPENAI_BASE_URL") or None,
+            http_client=DefaultHttpxClient(
+                http2=True, limits=httpx.Limits(max_keepalive_connections=20, max_connections=40)
+            ),
+        )
         # Defaults can be overridden via env
         self.chat_model = os.getenv("OPENAI_CHAT_MODEL", "gpt-4o-mini")
         self.embedding_model = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
@@ -29,7 +90,7 @@ class OpenAIClient:
         """
         if not audio_bytes:
             return ""
-        print(f"[OpenAIClient] transcribe_audio: size={len(audio_bytes)}, filename={filename}")
+        logger.debug("[OpenAIClient] transcribe_audio: size=%s, filename=%s", len(audio_bytes), filename)
         file_like = io.BytesIO(audio_bytes)
         file_like.name = filename
         resp = self.client.audio.transcriptions.create(
@@ -37,18 +98,66 @@ class OpenAIClient:
             file=file_like,
         )
         text = (resp.text or "").strip()
-        print(f"[OpenAIClient] transcribe_audio: got {len(text)} chars")
+        logger.debug("[OpenAIClient] transcribe_audio: got %s chars", len(text))
         return text
 
-    def create_embedding(self, text: str) -> List[float]:
+    def _embedding_key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.embedding_model}\x00{text}".encode()).hexdigest()
+
+    def _cached_embedding(self, key: str, persist: bool) -> Optional[array]:
+        """
+        Look up an embedding in the in-process LRU, then (for `persist` texts) the persistent store.
+        """
+        vec = _embedding_cache_get(key)
+        if vec is not None or not persist or self.supabase is None:
+            return vec
+        try:
+            stored = self.supabase.get_embedding_cache(key)
+        except Exception as e:
+            logger.warning("[OpenAIClient] embedding cache lookup failed: %s", e)
+            return None
+        if not stored:
+            return None
+        vec = array("f")
+        vec.frombytes(base64.b64decode(stored))
+        _embedding_cache_put(key, vec)
+        return vec
+
+    def _store_embedding(self, key: str, emb: List[float], persist: bool) -> None:
+        # float32 halves memory/storage vs. Python floats or JSON numbers.
+        vec = array("f", emb)
+        _embedding_cache_put(key, vec)
+        if persist and self.supabase is not None:
+            _embedding_persist_executor.submit(self._persist_embedding, key, vec)
+
+    def _persist_embedding(self, key: str, vec: array) -> None:
+        try:
+            self.supabase.save_embedding_cache(
+                key, self.embedding_model, base64.b64encode(vec.tobytes()).decode("ascii")
+            )
+        except Exception as e:
+            logger.warning("[OpenAIClient] embedding cache write failed: %s", e)
+
+    def create_embedding(self, text: str, persist: bool = False) -> List[float]:
+        """
+        Embed one text via the in-process LRU. `persist=True` (OCR/note texts, which recur across
+        workers) also reads/writes the Supabase cache; short free-form queries rarely hit there.
+        """
         text = (text or "").strip()
         if not text:
             return []
 
-        print(f"[OpenAIClient] create_embedding: len={len(text)}")
+        key = self._embedding_key(text)
+        cached = self._cached_embedding(key, persist)
+        if cached is not None:
+            logger.debug("[OpenAIClient] create_embedding: cache hit len=%s", len(text))
+            return cached.tolist()
+
+        logger.debug("[OpenAIClient] create_embedding: len=%s", len(text))
         resp = self.client.embeddings.create(model=self.embedding_model, input=text)
         emb = resp.data[0].embedding
-        print("[OpenAIClient] create_embedding: success")
+        self._store_embedding(key, emb, persist)
+        logger.debug("[OpenAIClient] create_embedding: success")
         return emb
 
     def generate_image(self, prompt: str, size: str = "1024x1024") -> bytes:
@@ -82,7 +191,7 @@ class OpenAIClient:
             max_tokens=max_tokens,
         )
         out = (msg.get("content") or "").strip()
-        print("[OpenAIClient] chat: got response")
+        logger.debug("[OpenAIClient] chat: got response")
         return out
 
     def chat_stream(self, system: str, user: str, temperature: float = 0.2, max_tokens: int = 300) -> Iterable[str]:
@@ -117,16 +226,18 @@ class OpenAIClient:
             "model": self.chat_model,
             "messages": messages,
         }
-        print(f"[OpenAIClient] _chat_raw: kwargs: {kwargs}")
         if tools is not None:
             kwargs["tools"] = tools
         if tool_choice is not None:
             kwargs["tool_choice"] = tool_choice
 
         resp = self.client.chat.completions.create(**kwargs)
-        print(f"[OpenAIClient] _chat_raw: response: {resp}")
         choice = resp.choices[0]
-        print("[OpenAIClient] _chat_raw: completion received")
+        logger.debug(
+            "[OpenAIClient] _chat_raw: completion id=%s total_tokens=%s",
+            resp.id,
+            resp.usage.total_tokens if resp.usage else None,
+        )
         # `choice.message` is an object; we convert to a dict-like for downstream code.
         msg: Dict[str, Any] = {
             "role": choice.message.role,
@@ -169,7 +280,7 @@ class OpenAIClient:
         ]
 
         for _ in range(max_steps):
-            print("[OpenAIClient] agent_chat: requesting step with tools")
+            logger.debug("[OpenAIClient] agent_chat: requesting step with tools")
             msg = self._chat_raw(
                 messages=messages,
                 temperature=temperature,
@@ -180,10 +291,10 @@ class OpenAIClient:
 
             tool_calls = msg.get("tool_calls") or []
             if tool_calls:
-                print(f"[OpenAIClient] agent_chat: model requested {len(tool_calls)} tool call(s)")
+                logger.debug("[OpenAIClient] agent_chat: model requested %s tool call(s)", len(tool_calls))
             if not tool_calls:
                 out = (msg.get("content") or "").strip()
-                print("[OpenAIClient] agent_chat: no tool calls, returning answer")
+                logger.debug("[OpenAIClient] agent_chat: no tool calls, returning answer")
                 return out
 
             messages.append(
@@ -194,21 +305,30 @@ class OpenAIClient:
                 }
             )
 
+            calls = []
             for tc in tool_calls:
                 fn = (tc.get("function") or {}).get("name")
                 raw_args = (tc.get("function") or {}).get("arguments") or "{}"
                 try:
-                    args = json.loads(raw_args) if isinstance(raw_args, str) else raw_args
+                    args = orjson.loads(raw_args) if isinstance(raw_args, (str, bytes)) else raw_args
                 except Exception:
                     args = {}
+                calls.append((fn, args))
+
+            logger.debug("[OpenAIClient] agent_chat: executing tools %s", [fn for fn, _ in calls])
+            if len(calls) > 1:
+                # Parallel tool calls (e.g. search_records + get_recent_records) are independent I/O
+                with ThreadPoolExecutor(max_workers=len(calls)) as pool:
+                    results = list(pool.map(lambda c: tool_executor(*c), calls))
+            else:
+                results = [tool_executor(*calls[0])]
 
-                print(f"[OpenAIClient] agent_chat: executing tool '{fn}'")
-                result = tool_executor(fn, args)
+            for tc, result in zip(tool_calls, results):
                 messages.append(
                     {
                         "role": "tool",
                         "tool_call_id": tc.get("id"),
-                        "content": json.dumps(result, ensure_ascii=False),
+                        "content": orjson.dumps(result).decode("utf-8"),
                     }
                 )
 
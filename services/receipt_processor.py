@@ -6,14 +6,165 @@ Record processing pipeline:
 """
 
 import requests
+import hashlib
 import json
-from datetime import datetime
+import logging
+import re
+import threading
+import time
+from datetime import datetime, timezone
 import uuid
-from typing import Dict, Any, List
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Any, List, Tuple
 
 from services.supabase_client import SupabaseClient
 from services.mistral_ocr import MistralOCR
 from services.openai_client import OpenAIClient
+from services.http_session import build_session, is_transient_error
+
+logger = logging.getLogger(__name__)
+
+# Cheap intent rules checked before the answer call classifies the message.
+_CALL_HINT_RE = re.compile(r"\b(call|phone|dial|ring)\b")
+# Only unmistakable save commands followed by content; "add up..." / "track my spending..." can be questions.
+_SAVE_RE = re.compile(r"^(remember|save|note)\b[\s:,-]+\S")
+
+# Recently processed media, keyed by content hash -> (storage_url, ocr_text). The TTL stays well under
+# the signed URL lifetime so a reused URL is still valid when the record is read back.
+_MEDIA_CACHE_MAXSIZE = 256
+_MEDIA_CACHE_TTL_SECONDS = 60 * 60
+
+# Conversation context sent to the LLM: newest K messages, capped in total characters.
+_HISTORY_MAX_MESSAGES = 8
+_HISTORY_MAX_CHARS = 2000
+
+# Prompts and tool schemas are immutable; build them once at import.
+_ANSWER_SYSTEM = (
+    "You are a WhatsApp capture-bot assistant.\n"
+    "You have tools to search the user's saved records.\n"
+    "You are also given recent conversation messages as context.\n"
+    "Use tools and conversation context when needed to answer.\n"
+    "Answer concisely.\n"
+    "If the answer is not in the records, say you don't know and ask what to save.\n"
+    "If you decide the response should be an image, call `format_response_as_image`.\n"
+    "Then your final message MUST be STRICT JSON with this shape:\n"
+    '{"type":"image","caption":"...","image_url":"...","text":"..."}\n'
+    "Use the tool output for `image_url` and `caption`.\n"
+    "If you do NOT call the image tool, return plain text (no JSON).\n"
+    "Do not mention embeddings, vectors, Supabase, or internal tooling."
+)
+
+# Server-side cap on records returned by a single tool call.
+_TOOL_MAX_RESULTS = 5
+
+# Used when intent wasn't decided by rule: classify and answer in one agent call.
+_INTENT_SENTINELS = {"SAVE_RECORD": "save_record", "CALL": "call"}
+_CLASSIFY_ANSWER_SYSTEM = (
+    "First classify the latest user message:\n"
+    "- If the user is stating something to remember, logging info, or saving a note, "
+    "reply with exactly SAVE_RECORD and call no tools.\n"
+    "- If the user asks to call someone, phone someone, place a call, or dial a number, "
+    "reply with exactly CALL and call no tools.\n"
+    "- Otherwise treat it as a question and answer as follows.\n\n"
+) + _ANSWER_SYSTEM
+
+_ANSWER_TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "search_records",
+            "description": "Semantic search over the user's saved records (OCR text + notes).",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {"type": "string"},
+                    "top_k": {"type": "integer", "minimum": 1, "maximum": _TOOL_MAX_RESULTS, "default": 5},
+                },
+                "required": ["query"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_recent_records",
+            "description": "Fetch the user's most recent saved records.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "limit": {"type": "integer", "minimum": 1, "maximum": _TOOL_MAX_RESULTS, "default": 5}
+                },
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "format_response_as_image",
+            "description": "Render the final answer as an image and return a Supabase URL. Use this for tables, checklists, or when the user explicitly asks for an image/visual.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "image_prompt": {
+                        "type": "string",
+                        "description": "A concise prompt describing the image content/layout (what to show), not the WhatsApp message caption.",
+                    },
+                    "caption": {
+                        "type": "string",
+                        "description": "Short WhatsApp caption to accompany the image (<= 1000 chars).",
+                    },
+                },
+                "required": ["image_prompt"],
+            },
+        },
+    },
+]
+
+
+def _format_history(history: List[Dict[str, Any]] | None, per_msg_chars: int) -> str:
+    """
+    Render recent conversation for a prompt: newest K messages in chronological order,
+    each truncated to `per_msg_chars`, capped at _HISTORY_MAX_CHARS overall.
+    """
+    if not history:
+        return ""
+    # history is most-recent-first; key on the fields we render so repeats hit the cache
+    rows = tuple(
+        (m.get("role", "user"), m.get("direction", "in"), m.get("content") or "")
+        for m in history[:_HISTORY_MAX_MESSAGES]
+    )
+    return _format_history_rows(rows, per_msg_chars)
+
+
+@lru_cache(maxsize=512)
+def _format_history_rows(rows: Tuple[Tuple[str, str, str], ...], per_msg_chars: int) -> str:
+    return "\n".join(
+        f"{role}({direction}): {content[:per_msg_chars].replace(chr(10), ' ')}"
+        for role, direction, content in reversed(rows)
+    )[-_HISTORY_MAX_CHARS:]
+
+
+def _relative_age(created_at: str | None) -> str:
+    """
+    Compact relative age ('5m ago', '3h ago', '2d ago') for a record timestamp; tokenizes
+    far shorter than an ISO string.
+    """
+    if not created_at:
+        return ""
+    try:
+        ts = datetime.fromisoformat(str(created_at).replace("Z", "+00:00"))
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+    except ValueError:
+        return str(created_at)
+    seconds = max(0, int((datetime.now(timezone.utc) - ts).total_seconds()))
+    if seconds < 3600:
+        return f"{seconds // 60}m ago"
+    if seconds < 86400:
+        return f"{seconds // 3600}h ago"
+    return f"{seconds // 86400}d ago"
 
 
 class RecordProcessor:
@@ -23,6 +174,13 @@ class RecordProcessor:
         self.supabase = supabase_client
         self.ocr = mistral_ocr
         self.openai = openai
+        self._session = build_session()
+        self._media_cache: "OrderedDict[bytes, Tuple[str, str, float]]" = OrderedDict()
+        self._media_lock = threading.Lock()
+
+    def close(self) -> None:
+        """Release pooled HTTP connections."""
+        self._session.close()
 
     def process_media_urls(self, media_urls: List[str], phone_number: str, message_sid: str) -> Dict[str, Any]:
         """
@@ -32,35 +190,22 @@ class RecordProcessor:
             if not media_urls:
                 return {"success": False, "error": "No media URLs provided"}
 
-            print(f"[RecordProcessor] process_media_urls: {len(media_urls)} URL(s) for {phone_number}")
-
-            storage_urls: List[str] = []
-            ocr_texts: List[str] = []
-
-            for media_url in media_urls:
-                print(f"[RecordProcessor] Downloading media: {media_url}")
-                media_response = requests.get(media_url, timeout=30)
-                media_response.raise_for_status()
-                file_content = media_response.content
-
-                content_type = media_response.headers.get("Content-Type", "image/jpeg")
-                file_name = media_url.split("/")[-1] or "upload"
+            logger.debug(
+                "[RecordProcessor] process_media_urls: %s URL(s) for %s", len(media_urls), phone_number
+            )
 
-                print(f"[RecordProcessor] Uploading to storage: {file_name} ({content_type})")
-                storage_url = self.supabase.upload_file(
-                    file_content=file_content, file_name=file_name, content_type=content_type
-                )
-                storage_urls.append(storage_url)
+            # Each attachment is independent network I/O (download, upload, OCR), so overlap them.
+            # `map` preserves input order, keeping storage_urls/ocr_texts deterministic.
+            with ThreadPoolExecutor(max_workers=min(4, len(media_urls))) as executor:
+                results = list(executor.map(self._process_one, media_urls))
 
-                print(f"[RecordProcessor] Running OCR via Mistral on: {storage_url}")
-                text = self.ocr.extract_text(storage_url, content_type=content_type)
-                if text:
-                    ocr_texts.append(text)
+            storage_urls: List[str] = [storage_url for storage_url, _ in results]
+            ocr_texts: List[str] = [text for _, text in results if text]
 
             combined_text = "\n\n---\n\n".join(ocr_texts).strip()
-            print(f"[RecordProcessor] Combined OCR text length: {len(combined_text)}")
-            embedding = self.openai.create_embedding(combined_text) if combined_text else []
-            print(f"[RecordProcessor] Embedding generated: dim={len(embedding) if embedding else 0}")
+            logger.debug("[RecordProcessor] Combined OCR text length: %s", len(combined_text))
+            embedding = self.openai.create_embedding(combined_text, persist=True) if combined_text else []
+            logger.debug("[RecordProcessor] Embedding generated: dim=%s", len(embedding) if embedding else 0)
 
             record = {
                 "phone_number": phone_number,
@@ -72,19 +217,76 @@ class RecordProcessor:
                 "metadata": {"source": "whatsapp", "media_count": len(storage_urls)},
             }
 
-            print("[RecordProcessor] Saving media record to Supabase")
+            logger.debug("[RecordProcessor] Saving media record to Supabase")
             saved = self.supabase.save_record(record)
             return {"success": True, "record_id": saved.get("id"), "media_count": len(storage_urls)}
         except requests.exceptions.RequestException as e:
-            return {"success": False, "error": f"Failed to download media: {str(e)}"}
+            if is_transient_error(e):
+                # Let the Celery task retry the whole job with backoff
+                raise
+            return {"success": False, "error": f"Media request failed: {str(e)}"}
         except Exception as e:
             return {"success": False, "error": f"Processing error: {str(e)}"}
 
+    def _process_one(self, media_url: str) -> Tuple[str, str]:
+        """
+        Download a single media URL, upload it to storage and OCR it.
+
+        Returns:
+            (storage_url, ocr_text)
+        """
+        logger.debug("[RecordProcessor] Downloading media: %s", media_url)
+        media_response = self._session.get(media_url, timeout=30)
+        media_response.raise_for_status()
+        file_content = media_response.content
+
+        # Same bytes seen recently (Twilio retry, forwarded duplicate): reuse the stored object and its OCR text
+        content_key = hashlib.blake2b(file_content, digest_size=16).digest()
+        cached = self._cached_media(content_key)
+        if cached is not None:
+            logger.debug("[RecordProcessor] Media cache hit: %s", media_url)
+            return cached
+
+        content_type = media_response.headers.get("Content-Type", "image/jpeg")
+        file_name = media_url.split("/")[-1] or "upload"
+
+        logger.debug("[RecordProcessor] Uploading to storage: %s (%s)", file_name, content_type)
+        storage_url = self.supabase.upload_file(
+            file_content=file_content, file_name=file_name, content_type=content_type
+        )
+
+        logger.debug("[RecordProcessor] Running OCR via Mistral on: %s", storage_url)
+        # Mistral fetches images straight from the storage URL; the bytes we already hold are
+        # passed along for the OCR cache key (and PDF rasterization) so nothing is re-downloaded.
+        text = self.ocr.extract_text(storage_url, content_type=content_type, file_data=file_content)
+        if text:
+            self._remember_media(content_key, storage_url, text)
+        return storage_url, text
+
+    def _cached_media(self, key: bytes) -> Tuple[str, str] | None:
+        with self._media_lock:
+            entry = self._media_cache.get(key)
+            if entry is None:
+                return None
+            storage_url, text, stored_at = entry
+            if time.monotonic() - stored_at >= _MEDIA_CACHE_TTL_SECONDS:
+                del self._media_cache[key]
+                return None
+            self._media_cache.move_to_end(key)
+            return storage_url, text
+
+    def _remember_media(self, key: bytes, storage_url: str, text: str) -> None:
+        with self._media_lock:
+            self._media_cache[key] = (storage_url, text, time.monotonic())
+            self._media_cache.move_to_end(key)
+            while len(self._media_cache) > _MEDIA_CACHE_MAXSIZE:
+                self._media_cache.popitem(last=False)
+
     def save_note(self, phone_number: str, message_sid: str, user_text: str) -> Dict[str, Any]:
         try:
-            print(f"[RecordProcessor] save_note for {phone_number}, text length={len(user_text)}")
-            embedding = self.openai.create_embedding(user_text)
-            print(f"[RecordProcessor] Note embedding dim={len(embedding) if embedding else 0}")
+            logger.debug("[RecordProcessor] save_note for %s, text length=%s", phone_number, len(user_text))
+            embedding = self.openai.create_embedding(user_text, persist=True)
+            logger.debug("[RecordProcessor] Note embedding dim=%s", len(embedding) if embedding else 0)
             record = {
                 "phone_number": phone_number,
                 "message_sid": message_sid,
@@ -93,46 +295,27 @@ class RecordProcessor:
                 "embedding": embedding if embedding else None,
                 "metadata": {"source": "whatsapp"},
             }
-            print("[RecordProcessor] Saving note record to Supabase")
+            logger.debug("[RecordProcessor] Saving note record to Supabase")
             saved = self.supabase.save_record(record)
             return {"success": True, "record_id": saved.get("id")}
         except Exception as e:
             return {"success": False, "error": f"Failed to save note: {str(e)}"}
 
-    def detect_intent(self, message: str, history: List[Dict[str, Any]] | None = None) -> str:
+    @staticmethod
+    def quick_intent(message: str) -> str | None:
         """
-        Returns: 'question' | 'save_record' | 'call'
+        Rule-based intent for obvious messages: 'question' | 'save_record', or None when ambiguous.
+        Anything that mentions calling is left to the model so call requests aren't misread as questions.
         """
-        # Build short conversation context from recent messages if provided
-        history_text = ""
-        if history:
-            # history is most-recent-first; reverse to chronological
-            lines: List[str] = []
-            for m in reversed(history):
-                role = m.get("role", "user")
-                direction = m.get("direction", "in")
-                txt = (m.get("content") or "")[:120].replace("\n", " ")
-                lines.append(f"{role}({direction}): {txt}")
-            history_text = "\n".join(lines)
-
-        system = (
-            "You classify user WhatsApp messages for a personal capture bot.\n"
-            "You will be given the recent conversation and the latest user message.\n"
-            "Return exactly one token: question OR save_record OR call.\n"
-            "- If the user asks to call someone, phone someone, place a call, or dial a number: call.\n"
-            "- If the user asks anything, requests info, or wants to find something: question.\n"
-            "- If the user is stating something to remember, logging info, or saving a note: save_record.\n"
-        )
-        user = f"Recent conversation:\n{history_text or '(none)'}\n\nLatest user message:\n{message}"
-
-        print(f"[RecordProcessor] detect_intent: message='{message[:80]}'")
-        out = self.openai.chat(system=system, user=user, temperature=0.0, max_tokens=5).lower()
-        print(f"[RecordProcessor] detect_intent raw output: '{out}'")
-        if "call" in out:
-            return "call"
-        if "save_record" in out:
+        msg = (message or "").strip().lower()
+        if _CALL_HINT_RE.search(msg):
+            return None
+        # A leading "was/is/list..." also starts notes ("Was at Costco, spent $54"): only a "?" decides
+        if msg.endswith("?"):
+            return "question"
+        if _SAVE_RE.match(msg):
             return "save_record"
-        return "question"
+        return None
 
     def extract_call_request(self, message: str) -> Dict[str, str]:
         """
@@ -185,102 +368,68 @@ class RecordProcessor:
         }
 
     def answer_question(
-        self, phone_number: str, question: str, history: List[Dict[str, Any]] | None = None
+        self,
+        phone_number: str,
+        question: str,
+        history: List[Dict[str, Any]] | None = None,
+        classify: bool = False,
+        question_embedding: List[float] | None = None,
     ) -> Dict[str, Any]:
+        """
+        Answer a question with the tool-using agent.
+
+        With `classify=True` the same call also classifies the message (saving an intent-detection
+        round-trip): if the model decides it's a note or a call request, the result carries
+        `intent` ('save_record' | 'call') and no answer. Otherwise `intent` is 'question'.
+        `question_embedding`, if the caller already has it, is reused when the agent searches
+        with the question text itself.
+        """
         try:
-            print(f"[RecordProcessor] answer_question for {phone_number}: '{question[:120]}'")
-            tools = [
-                {
-                    "type": "function",
-                    "function": {
-                        "name": "search_records",
-                        "description": "Semantic search over the user's saved records (OCR text + notes).",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "query": {"type": "string"},
-                                "top_k": {"type": "integer", "minimum": 1, "maximum": 10, "default": 5},
-                            },
-                            "required": ["query"],
-                        },
-                    },
-                },
-                {
-                    "type": "function",
-                    "function": {
-                        "name": "get_recent_records",
-                        "description": "Fetch the user's most recent saved records.",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {"limit": {"type": "integer", "minimum": 1, "maximum": 10, "default": 5}},
-                        },
-                    },
-                },
-                {
-                    "type": "function",
-                    "function": {
-                        "name": "format_response_as_image",
-                        "description": "Render the final answer as an image and return a Supabase URL. Use this for tables, checklists, or when the user explicitly asks for an image/visual.",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "image_prompt": {
-                                    "type": "string",
-                                    "description": "A concise prompt describing the image content/layout (what to show), not the WhatsApp message caption.",
-                                },
-                                "caption": {
-                                    "type": "string",
-                                    "description": "Short WhatsApp caption to accompany the image (<= 1000 chars).",
-                                },
-                            },
-                            "required": ["image_prompt"],
-                        },
-                    },
-                },
-            ]
+            logger.debug("[RecordProcessor] answer_question for %s: '%s'", phone_number, question[:120])
 
             def tool_executor(name: str, args: Dict[str, Any]) -> Dict[str, Any]:
-                print(f"[RecordProcessor] tool_executor called: {name} args={args}")
+                logger.debug("[RecordProcessor] tool_executor called: %s args=%s", name, args)
                 if name == "search_records":
                     q = (args.get("query") or "").strip()
-                    top_k = int(args.get("top_k") or 5)
-                    print(f"[RecordProcessor] search_records: query='{q[:80]}', top_k={top_k}")
-                    emb = self.openai.create_embedding(q)
+                    top_k = max(1, min(int(args.get("top_k") or _TOOL_MAX_RESULTS), _TOOL_MAX_RESULTS))
+                    logger.debug("[RecordProcessor] search_records: query='%s', top_k=%s", q[:80], top_k)
+                    if question_embedding and q == question.strip():
+                        emb = question_embedding
+                    else:
+                        emb = self.openai.create_embedding(q)
                     matches = self.supabase.match_records(
                         phone_number=phone_number, query_embedding=emb, match_count=top_k
                     )
-                    # Keep payload small + safe
-                    out = []
-                    for m in matches:
-                        out.append(
-                            {
-                                "id": m.get("id"),
-                                "record_type": m.get("record_type"),
-                                "created_at": m.get("created_at"),
-                                "similarity": m.get("similarity"),
-                                "text": (m.get("ocr_text") or m.get("user_text") or "")[:3000],
-                            }
-                        )
-                    print(f"[RecordProcessor] search_records: {len(out)} match(es)")
-                    return {"matches": out}
+                    # Compact rows keep the next LLM step's input (and latency) small
+                    out = [
+                        [
+                            m.get("id"),
+                            m.get("record_type"),
+                            _relative_age(m.get("created_at")),
+                            round(float(m.get("similarity") or 0.0), 2),
+                            (m.get("ocr_text") or m.get("user_text") or "")[:500],
+                        ]
+                        for m in matches
+                    ]
+                    logger.debug("[RecordProcessor] search_records: %s match(es)", len(out))
+                    return {"columns": ["id", "type", "age", "similarity", "text"], "matches": out}
 
                 if name == "get_recent_records":
-                    limit = int(args.get("limit") or 5)
-                    print(f"[RecordProcessor] get_recent_records: limit={limit}")
+                    limit = max(1, min(int(args.get("limit") or _TOOL_MAX_RESULTS), _TOOL_MAX_RESULTS))
+                    logger.debug("[RecordProcessor] get_recent_records: limit=%s", limit)
                     recs = self.supabase.get_records_by_phone(phone_number=phone_number, limit=limit)
-                    out = []
-                    for r in recs:
-                        out.append(
-                            {
-                                "id": r.get("id"),
-                                "record_type": r.get("record_type"),
-                                "created_at": r.get("created_at"),
-                                "text": ((r.get("ocr_text") or r.get("user_text") or "")[:1500]),
-                                "asset_urls": r.get("storage_urls", []),
-                            }
-                        )
-                    print(f"[RecordProcessor] get_recent_records: {len(out)} record(s)")
-                    return {"records": out}
+                    out = [
+                        [
+                            r.get("id"),
+                            r.get("record_type"),
+                            _relative_age(r.get("created_at")),
+                            (r.get("ocr_text") or r.get("user_text") or "")[:300],
+                            r.get("storage_urls", []),
+                        ]
+                        for r in recs
+                    ]
+                    logger.debug("[RecordProcessor] get_recent_records: %s record(s)", len(out))
+                    return {"columns": ["id", "type", "age", "text", "asset_urls"], "records": out}
 
                 if name == "format_response_as_image":
                     image_prompt = str(args.get("image_prompt") or "").strip()
@@ -300,42 +449,19 @@ class RecordProcessor:
                 return {"error": f"unknown_tool:{name}"}
 
             # Build short conversation context from recent messages if provided
-            history_text = ""
-            if history:
-                lines: List[str] = []
-                for m in reversed(history):
-                    role = m.get("role", "user")
-                    direction = m.get("direction", "in")
-                    txt = (m.get("content") or "")[:200].replace("\n", " ")
-                    lines.append(f"{role}({direction}): {txt}")
-                history_text = "\n".join(lines)
-
-            system = (
-                "You are a WhatsApp capture-bot assistant.\n"
-                "You have tools to search the user's saved records.\n"
-                "You are also given recent conversation messages as context.\n"
-                "Use tools and conversation context when needed to answer.\n"
-                "Answer concisely.\n"
-                "If the answer is not in the records, say you don't know and ask what to save.\n"
-                "If you decide the response should be an image, call `format_response_as_image`.\n"
-                "Then your final message MUST be STRICT JSON with this shape:\n"
-                '{"type":"image","caption":"...","image_url":"...","text":"..."}\n'
-                "Use the tool output for `image_url` and `caption`.\n"
-                "If you do NOT call the image tool, return plain text (no JSON).\n"
-                "Do not mention embeddings, vectors, Supabase, or internal tooling."
-            )
+            history_text = _format_history(history, 200)
 
             answer = self.openai.agent_chat(
-                system=system,
+                system=_CLASSIFY_ANSWER_SYSTEM if classify else _ANSWER_SYSTEM,
                 user=f"Recent conversation:\n{history_text or '(none)'}\n\nUser question:\n{question}",
-                tools=tools,
+                tools=_ANSWER_TOOLS,
                 tool_executor=tool_executor,
                 max_steps=4,
                 temperature=0.2,
                 max_tokens=500,
             )
 
-            print("[RecordProcessor] answer_question complete")
+            logger.debug("[RecordProcessor] answer_question complete")
             final = (answer or "").strip()
             # Models sometimes wrap JSON in markdown fences.
             if final.startswith("```"):
@@ -344,6 +470,14 @@ class RecordProcessor:
                     cleaned = cleaned[4:].strip()
                 final = cleaned
 
+            if classify:
+                sentinel = final.strip(" .`'\"").upper()
+                if sentinel in _INTENT_SENTINELS:
+                    logger.debug(
+                        "[RecordProcessor] answer_question classified as %s", _INTENT_SENTINELS[sentinel]
+                    )
+                    return {"success": True, "intent": _INTENT_SENTINELS[sentinel]}
+
             # If the model returned an image payload, pass it up to the WhatsApp sender.
             try:
                 parsed = json.loads(final)
@@ -356,10 +490,11 @@ class RecordProcessor:
                             "image_url": str(parsed.get("image_url") or "").strip(),
                             "text": str(parsed.get("text") or "").strip(),
                         },
+                        "intent": "question",
                     }
             except Exception:
                 pass
 
-            return {"success": True, "answer": final}
+            return {"success": True, "answer": final, "intent": "question"}
         except Exception as e:
             return {"success": False, "error": f"Failed to answer: {str(e)}"}
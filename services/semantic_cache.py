@@ -0,0 +1,79 @@
+"""
+In-process semantic cache: reuse an answer when a new question embeds close to a recent one.
+"""
+
+import math
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from operator import mul
+from collections.abc import Sequence
+from typing import Any
+
+
+def _normalize(vec: Sequence[float]) -> array:
+    norm = math.sqrt(sum(x * x for x in vec)) or 1.0
+    return array("f", (x / norm for x in vec))
+
+
+class SemanticCache:
+    """
+    Per-namespace (e.g. phone number) LRU of (L2-normalized embedding, value) entries with a TTL.
+    A lookup hits when the cosine similarity to a fresh entry is >= `threshold`.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.85,
+        ttl_seconds: float = 300.0,
+        max_entries: int = 1000,
+        max_per_namespace: int = 20,
+    ):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_per_namespace = max_per_namespace
+        self._data: "OrderedDict[str, list[tuple[array, Any, float]]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, namespace: str, embedding: Sequence[float]) -> Any | None:
+        if not embedding:
+            return None
+        query = _normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            entries = self._data.get(namespace)
+            if not entries:
+                return None
+            fresh = [e for e in entries if now - e[2] < self.ttl_seconds]
+            self._size -= len(entries) - len(fresh)
+            if not fresh:
+                del self._data[namespace]
+                return None
+            self._data[namespace] = fresh
+            score, value = max(
+                ((sum(map(mul, query, vec)), value) for vec, value, _ in fresh), key=lambda t: t[0]
+            )
+            if score < self.threshold:
+                return None
+            self._data.move_to_end(namespace)
+            return value
+
+    def put(self, namespace: str, embedding: Sequence[float], value: Any) -> None:
+        if not embedding:
+            return
+        entry = (_normalize(embedding), value, time.monotonic())
+        with self._lock:
+            entries = self._data.setdefault(namespace, [])
+            entries.append(entry)
+            self._size += 1
+            if len(entries) > self.max_per_namespace:
+                del entries[0]
+                self._size -= 1
+            self._data.move_to_end(namespace)
+            # Evict least-recently-used namespaces until we're back under the global bound
+            while self._size > self.max_entries and self._data:
+                _, evicted = self._data.popitem(last=False)
+                self._size -= len(evicted)
@@ -2,14 +2,34 @@
 Supabase client for database and storage operations
 """
 
+import base64
+import hashlib
+import hmac
+import logging
 import os
-from supabase import create_client, Client
-from typing import Optional, Dict, Any
+import httpx
+import orjson
+from postgrest.types import ReturnMethod
+from supabase import create_client, Client, ClientOptions
+from typing import Any
 import uuid
 import requests
-from urllib.parse import urlparse, unquote
+from urllib.parse import quote, urlparse, unquote
 import time
 
+logger = logging.getLogger(__name__)
+
+
+def _b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _first_row(data: Any) -> dict[str, Any]:
+    """Single row from a PostgREST/RPC response, which may be an object, a list, or empty."""
+    if isinstance(data, list):
+        return data[0] if data else {}
+    return data or {}
+
 
 class SupabaseClient:
     """Handles all Supabase operations"""
@@ -21,11 +41,55 @@ class SupabaseClient:
         if not url or not key:
             raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in environment variables")
 
-        self.client: Client = create_client(url, key)
+        # One pooled HTTP client for PostgREST/Storage so TCP+TLS sessions are reused across calls.
+        http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10), timeout=60.0
+        )
+        self.client: Client = create_client(url, key, options=ClientOptions(httpx_client=http_client))
+        # Direct PostgREST access for the heavy writes/RPCs (embeddings, job payloads), encoded with orjson
+        self._http = http_client
+        self._rest_url = f"{url.rstrip('/')}/rest/v1"
+        self._rest_headers = {"apikey": key, "Authorization": f"Bearer {key}", "Content-Type": "application/json"}
+        self._storage_url = f"{url.rstrip('/')}/storage/v1"
+        # With the project's JWT secret, signed Storage URLs are minted locally instead of via an API call
+        jwt_secret = os.getenv("SUPABASE_JWT_SECRET")
+        self._jwt_secret = jwt_secret.encode("utf-8") if jwt_secret else None
         self.storage_bucket = os.getenv("SUPABASE_STORAGE_BUCKET", "whatsapp")
         self.records_table = os.getenv("SUPABASE_RECORDS_TABLE", "wbot_records")
         self.messages_table = os.getenv("SUPABASE_MESSAGES_TABLE", "wbot_messages")
         self.jobs_table = os.getenv("SUPABASE_JOBS_TABLE", "wbot_jobs")
+        self.ocr_cache_table = os.getenv("SUPABASE_OCR_CACHE_TABLE", "wbot_ocr_cache")
+        self.embedding_cache_table = os.getenv("SUPABASE_EMBEDDING_CACHE_TABLE", "wbot_embedding_cache")
+
+    def _post(self, path: str, body: Any, prefer: str | None = None) -> Any:
+        """
+        POST an orjson-encoded body to PostgREST (`/rest/v1/<path>`) on the pooled client and decode the
+        reply with orjson. supabase-py encodes with stdlib json, which is slow for embedding-sized lists.
+        """
+        headers = self._rest_headers if prefer is None else {**self._rest_headers, "Prefer": prefer}
+        resp = self._http.post(f"{self._rest_url}/{path}", content=orjson.dumps(body), headers=headers)
+        if resp.is_error:
+            raise Exception(f"PostgREST {resp.status_code}: {resp.text}")
+        return orjson.loads(resp.content) if resp.content else None
+
+    def _rpc(self, fn: str, params: dict[str, Any]) -> Any:
+        return self._post(f"rpc/{fn}", params)
+
+    def _sign_locally(self, bucket: str, object_path: str, expires_in_seconds: int) -> str | None:
+        """
+        Build a Storage signed URL without a round-trip. Supabase's signed-URL token is an HS256 JWT over
+        {"url": "<bucket>/<path>", "iat", "exp"} with the project JWT secret. Returns None if the secret isn't set.
+        """
+        if not self._jwt_secret:
+            return None
+        now = int(time.time())
+        header = _b64url(b'{"alg":"HS256","typ":"JWT"}')
+        payload = _b64url(
+            orjson.dumps({"url": f"{bucket}/{object_path}", "iat": now, "exp": now + expires_in_seconds})
+        )
+        signing_input = f"{header}.{payload}"
+        signature = _b64url(hmac.new(self._jwt_secret, signing_input.encode("ascii"), hashlib.sha256).digest())
+        return f"{self._storage_url}/object/sign/{bucket}/{quote(object_path)}?token={signing_input}.{signature}"
 
     def upload_file(self, file_content: bytes, file_name: str, content_type: str) -> str:
         """
@@ -40,13 +104,14 @@ class SupabaseClient:
             Public URL of the uploaded file
         """
         # Generate unique file path
-        file_id = str(uuid.uuid4())
-        file_ext = file_name.split(".")[-1] if "." in file_name else "jpg"
+        file_id = uuid.uuid4().hex
+        _, ext = os.path.splitext(file_name)
+        file_ext = (ext[1:] or "jpg").lower()
         storage_path = f"{file_id}.{file_ext}"
 
         # Upload to storage
         try:
-            print(f"[SupabaseClient] upload_file: path={storage_path}, content_type={content_type}")
+            logger.debug("[SupabaseClient] upload_file: path=%s, content_type=%s", storage_path, content_type)
             self.client.storage.from_(self.storage_bucket).upload(
                 path=storage_path, file=file_content, file_options={"content-type": content_type}
             )
@@ -78,10 +143,15 @@ class SupabaseClient:
                 return False
 
         # Generate a time-limited signed URL for external access
+        expires_in_seconds = int(
+            os.getenv("SUPABASE_SIGNED_URL_EXPIRES_IN_SECONDS", str(60 * 60 * 24))
+        )  # default 24 hours
+        local_url = self._sign_locally(self.storage_bucket, storage_path, expires_in_seconds)
+        if local_url:
+            logger.debug("[SupabaseClient] upload_file: signed locally path=%s", storage_path)
+            return local_url
+
         try:
-            expires_in_seconds = int(
-                os.getenv("SUPABASE_SIGNED_URL_EXPIRES_IN_SECONDS", str(60 * 60 * 24))
-            )  # default 24 hours
             signed = self.client.storage.from_(self.storage_bucket).create_signed_url(
                 storage_path, expires_in=expires_in_seconds
             )
@@ -92,8 +162,9 @@ class SupabaseClient:
             # If the returned URL fails immediately (InvalidJWT), retry once with ms-style.
             if not _validate_url(url):
                 ms_expires_in = expires_in_seconds * 1000
-                print(
-                    f"[SupabaseClient] upload_file: signed url validation failed; retrying with ms expires_in={ms_expires_in}"
+                logger.debug(
+                    "[SupabaseClient] upload_file: signed url validation failed; retrying with ms expires_in=%s",
+                    ms_expires_in,
                 )
                 signed_retry = self.client.storage.from_(self.storage_bucket).create_signed_url(
                     storage_path, expires_in=ms_expires_in
@@ -103,15 +174,15 @@ class SupabaseClient:
                     if isinstance(signed_retry, dict)
                     else signed_retry
                 )
-                print(f"[SupabaseClient] upload_file: signed_url_retry={url_retry}")
+                logger.debug("[SupabaseClient] upload_file: signed_url_retry=%s", url_retry)
                 return str(url_retry)
 
-            print(f"[SupabaseClient] upload_file: signed_url={url}")
+            logger.debug("[SupabaseClient] upload_file: signed_url=%s", url)
             return str(url)
         except Exception as e:
             raise Exception(f"Failed to create signed URL from Supabase Storage: {str(e)}")
 
-    def save_record(self, record_data: Dict[str, Any]) -> Dict[str, Any]:
+    def save_record(self, record_data: dict[str, Any]) -> dict[str, Any]:
         """
         Save a record (media OCR text or user note) to Postgres.
 
@@ -122,26 +193,11 @@ class SupabaseClient:
             Saved record
         """
         try:
-            print(f"[SupabaseClient] save_record into {self.records_table}")
-            result = self.client.table(self.records_table).insert(record_data).execute()
-            return result.data[0] if result.data else {}
+            logger.debug("[SupabaseClient] save_record into %s", self.records_table)
+            return _first_row(self._post(self.records_table, record_data, prefer="return=representation"))
         except Exception as e:
             raise Exception(f"Failed to save record to database: {str(e)}")
 
-    def save_message(self, message_data: Dict[str, Any]) -> Dict[str, Any]:
-        """
-        Save a WhatsApp message (incoming or outgoing) for conversation context.
-
-        Args:
-            message_data: { phone_number, direction, role, content, message_sid?, metadata? }
-        """
-        try:
-            print(f"[SupabaseClient] save_message into {self.messages_table}")
-            result = self.client.table(self.messages_table).insert(message_data).execute()
-            return result.data[0] if result.data else {}
-        except Exception as e:
-            raise Exception(f"Failed to save message to database: {str(e)}")
-
     def get_records_by_phone(self, phone_number: str, limit: int = 10) -> list:
         """
         Get recent records for a phone number.
@@ -152,7 +208,7 @@ class SupabaseClient:
         Returns:
             List of receipt records
         """
-        print(f"[SupabaseClient] get_records_by_phone: phone={phone_number}, limit={limit}")
+        logger.debug("[SupabaseClient] get_records_by_phone: phone=%s, limit=%s", phone_number, limit)
         result = (
             self.client.table(self.records_table)
             .select("*")
@@ -162,7 +218,7 @@ class SupabaseClient:
             .execute()
         )
         data = result.data if result.data else []
-        print(f"[SupabaseClient] get_records_by_phone: found={len(data)}")
+        logger.debug("[SupabaseClient] get_records_by_phone: found=%s", len(data))
         return data
 
     def get_record_count(self, phone_number: str) -> int:
@@ -175,7 +231,7 @@ class SupabaseClient:
         Returns:
             Count of receipts
         """
-        print(f"[SupabaseClient] get_record_count: phone={phone_number}")
+        logger.debug("[SupabaseClient] get_record_count: phone=%s", phone_number)
         result = (
             self.client.table(self.records_table)
             .select("id", count="exact")
@@ -183,7 +239,7 @@ class SupabaseClient:
             .execute()
         )
         count = result.count if result.count else 0
-        print(f"[SupabaseClient] get_record_count: count={count}")
+        logger.debug("[SupabaseClient] get_record_count: count=%s", count)
         return count
 
     def match_records(self, phone_number: str, query_embedding: list, match_count: int = 5) -> list:
@@ -193,25 +249,26 @@ class SupabaseClient:
         if not query_embedding:
             return []
 
-        print(f"[SupabaseClient] match_records: phone={phone_number}, k={match_count}")
-        result = self.client.rpc(
-            "wbot_match_records",
-            {
-                "query_embedding": query_embedding,
-                "match_count": match_count,
-                "p_phone_number": phone_number,
-            },
-        ).execute()
-
-        data = result.data if result.data else []
-        print(f"[SupabaseClient] match_records: found={len(data)}")
+        logger.debug("[SupabaseClient] match_records: phone=%s, k=%s", phone_number, match_count)
+        data = (
+            self._rpc(
+                "wbot_match_records",
+                {
+                    "query_embedding": query_embedding,
+                    "match_count": match_count,
+                    "p_phone_number": phone_number,
+                },
+            )
+            or []
+        )
+        logger.debug("[SupabaseClient] match_records: found=%s", len(data))
         return data
 
     def get_messages_by_phone(self, phone_number: str, limit: int = 10) -> list:
         """
         Get recent conversation messages for a phone number (most recent first).
         """
-        print(f"[SupabaseClient] get_messages_by_phone: phone={phone_number}, limit={limit}")
+        logger.debug("[SupabaseClient] get_messages_by_phone: phone=%s, limit=%s", phone_number, limit)
         result = (
             self.client.table(self.messages_table)
             .select("*")
@@ -221,45 +278,135 @@ class SupabaseClient:
             .execute()
         )
         data = result.data if result.data else []
-        print(f"[SupabaseClient] get_messages_by_phone: found={len(data)}")
+        logger.debug("[SupabaseClient] get_messages_by_phone: found=%s", len(data))
         return data
 
+    # OCR cache helpers
+
+    def get_ocr_cache(self, content_hash: str) -> str | None:
+        """
+        Look up cached OCR text by content hash. Returns None on miss.
+        """
+        logger.debug("[SupabaseClient] get_ocr_cache: hash=%s", content_hash[:12])
+        result = (
+            self.client.table(self.ocr_cache_table).select("text").eq("hash", content_hash).limit(1).execute()
+        )
+        return result.data[0].get("text") if result.data else None
+
+    def save_ocr_cache(self, content_hash: str, text: str, model: str) -> None:
+        """
+        Store OCR text for a content hash (idempotent).
+        """
+        logger.debug("[SupabaseClient] save_ocr_cache: hash=%s", content_hash[:12])
+        self.client.table(self.ocr_cache_table).upsert(
+            {"hash": content_hash, "text": text, "model": model},
+            on_conflict="hash",
+            returning=ReturnMethod.minimal,
+        ).execute()
+
+    # Embedding cache helpers
+
+    def get_embedding_cache(self, key: str) -> str | None:
+        """
+        Look up a cached embedding (base64 float32 bytes) by key. Returns None on miss.
+        """
+        logger.debug("[SupabaseClient] get_embedding_cache: key=%s", key[:12])
+        result = (
+            self.client.table(self.embedding_cache_table).select("vector").eq("hash", key).limit(1).execute()
+        )
+        return result.data[0].get("vector") if result.data else None
+
+    def save_embedding_cache(self, key: str, model: str, vector_b64: str) -> None:
+        """
+        Store an embedding (base64 float32 bytes) for a key (idempotent).
+        """
+        logger.debug("[SupabaseClient] save_embedding_cache: key=%s", key[:12])
+        self.client.table(self.embedding_cache_table).upsert(
+            {"hash": key, "model": model, "vector": vector_b64},
+            on_conflict="hash",
+            returning=ReturnMethod.minimal,
+        ).execute()
+
     # Job helpers
 
-    def create_job(self, job_data: Dict[str, Any]) -> Dict[str, Any]:
+    def ingest_webhook(
+        self,
+        phone_number: str,
+        message_sid: str,
+        content: str,
+        metadata: dict[str, Any],
+        job_type: str,
+        payload: dict[str, Any],
+    ) -> dict[str, Any]:
+        """
+        Save the incoming message and create its job in a single RPC (`wbot_webhook_ingest`).
+        Returns the created job.
+        """
+        try:
+            logger.debug("[SupabaseClient] ingest_webhook: phone=%s, job_type=%s", phone_number, job_type)
+            result = self._rpc(
+                "wbot_webhook_ingest",
+                {
+                    "p_phone_number": phone_number,
+                    "p_message_sid": message_sid,
+                    "p_content": content,
+                    "p_metadata": metadata,
+                    "p_job_type": job_type,
+                    "p_payload": payload,
+                },
+            )
+            return _first_row(result)
+        except Exception as e:
+            raise Exception(f"Failed to ingest webhook: {str(e)}")
+
+    def update_job(self, job_id: str, updates: dict[str, Any]) -> None:
+        """
+        Update job fields (status, error, result, etc.).
+        """
+        try:
+            logger.debug("[SupabaseClient] update_job: id=%s, updates=%s", job_id, updates)
+            (
+                self.client.table(self.jobs_table)
+                .update(updates, returning=ReturnMethod.minimal)
+                .eq("id", job_id)
+                .execute()
+            )
+        except Exception as e:
+            raise Exception(f"Failed to update job: {str(e)}")
+
+    def claim_job(self, job_id: str, lease_seconds: int = 600) -> dict[str, Any]:
         """
-        Create a background job record and return it.
+        Atomically move a queued job to `processing` via the `wbot_claim_job` RPC.
+        A job left `processing` for longer than `lease_seconds` (its worker died) is claimed again.
+        Returns the claimed job, or {} if it is held by a live worker or already finished.
         """
         try:
-            print(f"[SupabaseClient] create_job into {self.jobs_table}")
-            result = self.client.table(self.jobs_table).insert(job_data).execute()
-            return result.data[0] if result.data else {}
+            logger.debug("[SupabaseClient] claim_job: id=%s", job_id)
+            return _first_row(self._rpc("wbot_claim_job", {"p_id": job_id, "p_lease_seconds": lease_seconds}))
         except Exception as e:
-            raise Exception(f"Failed to create job: {str(e)}")
+            raise Exception(f"Failed to claim job: {str(e)}")
 
-    def get_job(self, job_id: str) -> Dict[str, Any]:
+    def finish_job(self, job_id: str, result: dict[str, Any], message: dict[str, Any] | None = None) -> None:
         """
-        Get a job by ID.
+        Mark a job completed and save its outgoing message in a single RPC (`wbot_finish_job`).
         """
         try:
-            print(f"[SupabaseClient] get_job: id={job_id}")
-            result = self.client.table(self.jobs_table).select("*").eq("id", job_id).single().execute()
-            return result.data or {}
+            logger.debug("[SupabaseClient] finish_job: id=%s", job_id)
+            self._rpc("wbot_finish_job", {"p_job_id": job_id, "p_result": result, "p_message": message})
         except Exception as e:
-            raise Exception(f"Failed to get job: {str(e)}")
+            raise Exception(f"Failed to finish job: {str(e)}")
 
-    def update_job(self, job_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
+    def fail_job(self, job_id: str, error: str) -> None:
         """
-        Update job fields (status, error, result, etc.).
+        Mark a job failed via the `wbot_fail_job` RPC.
         """
         try:
-            print(f"[SupabaseClient] update_job: id={job_id}, updates={updates}")
-            result = self.client.table(self.jobs_table).update(updates).eq("id", job_id).execute()
-            return result.data[0] if result.data else {}
+            logger.debug("[SupabaseClient] fail_job: id=%s, error=%s", job_id, error)
+            self._rpc("wbot_fail_job", {"p_job_id": job_id, "p_error": error})
         except Exception as e:
-            raise Exception(f"Failed to update job: {str(e)}")
+            raise Exception(f"Failed to fail job: {str(e)}")
 
-    def resign_url(self, url: str, expires_in_seconds: Optional[int] = None) -> str:
+    def resign_url(self, url: str, expires_in_seconds: int | None = None) -> str:
         """
         Given a previously-signed Supabase Storage URL, drop the querystring and
         create a fresh signed URL for the same object.
@@ -292,6 +439,10 @@ class SupabaseClient:
         if expires_in_seconds is None:
             expires_in_seconds = int(os.getenv("SUPABASE_SIGNED_URL_EXPIRES_IN_SECONDS", str(60 * 60 * 24)))
 
+        local_url = self._sign_locally(bucket, object_path, expires_in_seconds)
+        if local_url:
+            return local_url
+
         try:
             signed = self.client.storage.from_(bucket).create_signed_url(
                 object_path, expires_in=expires_in_seconds
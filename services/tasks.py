@@ -5,11 +5,18 @@ IMPORTANT: Celery runs in a separate process, so we explicitly load `.env`
 here to make sure SUPABASE_*, TWILIO_*, OPENAI_* etc. are available.
 """
 
+import logging
 import os
+import queue
+import re
 import requests
-from typing import Any, Dict
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any
 
 from celery import Celery
+from celery.signals import celeryd_init, worker_process_init, worker_process_shutdown
+from twilio.base.exceptions import TwilioRestException
 from twilio.rest import Client as TwilioClient
 from dotenv import load_dotenv
 
@@ -19,81 +26,197 @@ from services.openai_client import OpenAIClient
 from services.receipt_processor import RecordProcessor
 from services.whatsapp_handler import WhatsAppHandler
 from services.call_service import CallService
+from services.http_session import is_transient_error
+
+logger = logging.getLogger(__name__)
+_log_listener: QueueListener | None = None
+
+
+_ENV_LOADED = False
 
 
 def make_celery() -> Celery:
-    # Ensure .env is loaded when the worker process starts
+    # Ensure .env is loaded when the worker process starts (once per process; find_dotenv walks the tree)
     # Assumes worker is started from project root, e.g.:
     #   cd whatsapp-bot && celery -A services.tasks.celery_app worker --loglevel=info
-    load_dotenv()
+    global _ENV_LOADED
+    if not _ENV_LOADED:
+        load_dotenv()
+        _ENV_LOADED = True
     broker_url = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
     backend_url = os.getenv("CELERY_RESULT_BACKEND", broker_url)
     app = Celery("whatsapp_bot", broker=broker_url, backend=backend_url)
+    # Ack after the task finishes and prefetch one message at a time, so a slow OCR job
+    # doesn't hold other queued messages hostage on the same worker.
+    app.conf.update(task_acks_late=True, worker_prefetch_multiplier=1)
     return app
 
 
 celery_app = make_celery()
 
 
-def _build_services():
-    supabase = SupabaseClient()
-    mistral = MistralOCR()
-    openai_client = OpenAIClient()
-    processor = RecordProcessor(supabase, mistral, openai_client)
+_WA_PREFIX = re.compile(r"^whatsapp:", re.I)
+
+
+@lru_cache(maxsize=4096)
+def _to_whatsapp(number: str) -> str:
+    """Normalize a phone number to Twilio's WhatsApp channel form ("whatsapp:+1234567890")."""
+    number = (number or "").strip()
+    if _WA_PREFIX.match(number) is not None:
+        return number
+    return f"whatsapp:{number}" if number.startswith("+") else f"whatsapp:+{number}"
+
+
+# Sender number, normalized once per process (Twilio sandbox e.g. whatsapp:+14155238886)
+_TWILIO_FROM = (os.getenv("TWILIO_WHATSAPP_NUMBER") or "").strip()
+if _TWILIO_FROM:
+    _TWILIO_FROM = _to_whatsapp(_TWILIO_FROM)
+
+# Twilio sends are pure network I/O: they go to a dedicated high-concurrency worker, e.g.
+#   celery -A services.tasks.celery_app worker -Q twilio --concurrency=16
+_REPLY_QUEUE = "twilio"
+
 
+@lru_cache(maxsize=1)
+def _twilio_client() -> TwilioClient:
+    """Twilio REST client, built once per process (shared by the job and reply tasks)."""
     twilio_account_sid = os.getenv("TWILIO_ACCOUNT_SID")
     twilio_auth_token = os.getenv("TWILIO_AUTH_TOKEN")
-    twilio_from = (os.getenv("TWILIO_WHATSAPP_NUMBER") or "").strip()
-    if not (twilio_account_sid and twilio_auth_token and twilio_from):
+    if not (twilio_account_sid and twilio_auth_token and _TWILIO_FROM):
         raise ValueError("Twilio env vars (TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_WHATSAPP_NUMBER) must be set")
-    # WhatsApp channel requires "whatsapp:+1234567890" format (Twilio sandbox e.g. whatsapp:+14155238886)
-    if not twilio_from.lower().startswith("whatsapp:"):
-        raw = twilio_from.lstrip()
-        twilio_from = f"whatsapp:{raw}" if raw.startswith("+") else f"whatsapp:+{raw}"
+    return TwilioClient(twilio_account_sid, twilio_auth_token)
 
-    twilio_client = TwilioClient(twilio_account_sid, twilio_auth_token)
+
+@lru_cache(maxsize=1)
+def _build_services():
+    """
+    Build the service graph once per worker process and reuse it across tasks, so HTTP
+    sessions and their connection pools (Supabase, Mistral, OpenAI, Twilio) stay warm.
+    """
+    supabase = SupabaseClient()
+    mistral = MistralOCR(supabase_client=supabase)
+    openai_client = OpenAIClient(supabase_client=supabase)
+    processor = RecordProcessor(supabase, mistral, openai_client)
+
+    twilio_client = _twilio_client()
     call_service = CallService(twilio_client=twilio_client, openai_client=openai_client)
     handler = WhatsAppHandler(processor, call_service=call_service)
 
-    return supabase, handler, openai_client, twilio_client, twilio_from
+    return supabase, handler, openai_client, twilio_client, _TWILIO_FROM
+
+
+def _start_log_listener() -> None:
+    """
+    Put the root logger's handlers behind a queue drained by a background thread,
+    so log calls from tasks never block on stream/file I/O.
+    """
+    global _log_listener
+    root = logging.getLogger()
+    handlers = [h for h in root.handlers if not isinstance(h, QueueHandler)]
+    if _log_listener is not None or not handlers:
+        return
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    for h in handlers:
+        root.removeHandler(h)
+    root.addHandler(QueueHandler(log_queue))
+    _log_listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _log_listener.start()
+
 
+# False on a worker that only consumes the reply queue: send_reply needs just the Twilio client.
+_warm_services = True
 
-@celery_app.task(name="process_whatsapp_job")
-def process_whatsapp_job(job_id: str) -> Dict[str, Any]:
+
+@celeryd_init.connect
+def _configure_worker(options=None, **_kwargs) -> None:
+    # Runs in the parent before the pool forks, so children inherit the flag.
+    global _warm_services
+    queues = (options or {}).get("queues") or []
+    if isinstance(queues, str):
+        queues = queues.split(",")
+    _warm_services = set(queues) != {_REPLY_QUEUE}
+
+
+@worker_process_init.connect
+def _init_worker_services(**_kwargs) -> None:
+    _start_log_listener()
+    # Build services when the (forked) worker process starts rather than on its first task.
+    if _warm_services:
+        _build_services()
+
+
+@worker_process_shutdown.connect
+def _close_worker_services(**_kwargs) -> None:
+    if _build_services.cache_info().currsize:
+        _, handler, _, _, _ = _build_services()
+        handler.processor.close()
+        handler.processor.ocr.close()
+    if _log_listener is not None:
+        # Flush queued records before the process exits
+        _log_listener.stop()
+
+
+# How long a `processing` job belongs to its worker before a redelivery may reclaim it: well above the
+# slowest job (multi-page OCR + agent answer) and below the Redis broker's visibility timeout (1h by
+# default), after which acks_late tasks from a crashed worker are redelivered.
+_JOB_LEASE_SECONDS = 600
+
+
+# Rate limit smooths bursts (e.g. 20 forwarded receipts) to stay within Mistral/OpenAI quotas.
+# Transient `requests` failures (media/audio downloads, Mistral OCR: connection errors, timeouts,
+# 429/5xx) are re-raised by the except branch below and retried with exponential backoff.
+@celery_app.task(
+    bind=True,
+    name="process_whatsapp_job",
+    rate_limit="20/m",
+    autoretry_for=(requests.RequestException,),
+    retry_backoff=True,
+    max_retries=3,
+)
+def process_whatsapp_job(self, ingest: dict[str, Any]) -> dict[str, Any]:
     """
-    Background job: process a WhatsApp message (media or text) and send a reply.
+    Background job: persist an incoming WhatsApp message + job, process it (media or text) and send a reply.
+
+    `ingest` carries the parsed webhook fields accepted by `SupabaseClient.ingest_webhook`.
     """
-    supabase, handler, openai_client, twilio_client, twilio_from = _build_services()
+    supabase, handler, openai_client, _, twilio_from = _build_services()
+
+    # Save the incoming message and create the job (idempotent on message_sid)
+    job = supabase.ingest_webhook(**ingest)
+    if not job:
+        return {"success": False, "error": "job_not_created"}
 
-    # Load job
-    job = supabase.get_job(job_id)
+    job_id = job.get("id")
+    # Conditional UPDATE ... RETURNING: only one delivery (Twilio retry or Celery redelivery) wins the job.
+    # A job orphaned in `processing` by a crashed worker is reclaimed once its lease runs out.
+    job = supabase.claim_job(job_id, lease_seconds=_JOB_LEASE_SECONDS)
     if not job:
-        return {"success": False, "error": "job_not_found", "job_id": job_id}
+        return {"success": False, "error": "already_claimed", "job_id": job_id}
 
     phone_number = job.get("phone_number")
     message_sid = job.get("message_sid") or ""
     job_type = job.get("job_type")
     payload = job.get("payload") or {}
+    # Set by wbot_webhook_ingest; first-time senders have no prior conversation to fetch
+    has_history = payload.get("has_history", True)
 
-    print(f"[tasks.py] Processing job: {job_id} for {phone_number} with type {job_type}")
+    logger.debug("[tasks.py] Processing job: %s for %s with type %s", job_id, phone_number, job_type)
     try:
-        supabase.update_job(job_id, {"status": "processing"})
-
         if job_type == "media":
             media_urls = payload.get("media_urls") or []
             response_text = handler.handle_media(
                 media_urls=media_urls, from_number=phone_number, message_sid=message_sid
             )
         elif job_type == "audio":
-            print(f"[tasks.py] Processing audio job: {job_id} for {phone_number}")
+            logger.debug("[tasks.py] Processing audio job: %s for %s", job_id, phone_number)
             media_urls = payload.get("media_urls") or []
             if not media_urls:
                 response_text = "No audio received."
-                print(f"[tasks.py] No audio received.")
+                logger.debug("[tasks.py] No audio received.")
             else:
                 # Download first audio and transcribe with OpenAI Whisper
                 audio_url = media_urls[0]
-                print(f"[tasks.py] Downloading audio: {audio_url}")
+                logger.debug("[tasks.py] Downloading audio: %s", audio_url)
                 r = requests.get(audio_url, timeout=30)
                 r.raise_for_status()
                 audio_bytes = r.content
@@ -110,7 +233,10 @@ def process_whatsapp_job(job_id: str) -> Dict[str, Any]:
                     response_text = "I couldn't transcribe the audio. Please try again or send a text message."
                 else:
                     response_text = handler.handle_text(
-                        message=transcribed, from_number=phone_number, message_sid=message_sid
+                        message=transcribed,
+                        from_number=phone_number,
+                        message_sid=message_sid,
+                        has_history=has_history,
                     )
         elif job_type == "location":
             lat = payload.get("latitude") or ""
@@ -124,21 +250,18 @@ def process_whatsapp_job(job_id: str) -> Dict[str, Any]:
                 parts.append(f"Address: {address}")
             location_text = "\n".join(parts)
             response_text = handler.handle_text(
-                message=location_text, from_number=phone_number, message_sid=message_sid
+                message=location_text, from_number=phone_number, message_sid=message_sid, has_history=has_history
             )
         elif job_type == "text":
             text = payload.get("text") or ""
-            response_text = handler.handle_text(message=text, from_number=phone_number, message_sid=message_sid)
+            response_text = handler.handle_text(
+                message=text, from_number=phone_number, message_sid=message_sid, has_history=has_history
+            )
         else:
             raise ValueError(f"Unsupported job_type: {job_type}")
 
-        # Update job result
-        supabase.update_job(job_id, {"status": "completed", "result": {"response": response_text}})
-
         # Send WhatsApp reply (From and To must both be whatsapp: channel)
-        to_number = (phone_number or "").strip()
-        if not to_number.lower().startswith("whatsapp:"):
-            to_number = f"whatsapp:{to_number}" if to_number.startswith("+") else f"whatsapp:+{to_number}"
+        to_number = _to_whatsapp(phone_number)
 
         media_url = None
         if isinstance(response_text, dict):
@@ -153,51 +276,67 @@ def process_whatsapp_job(job_id: str) -> Dict[str, Any]:
             body_text = response_text
             db_content = response_text
 
-        print(f"[tasks.py] Sending WhatsApp reply to {to_number} from {twilio_from}")
         if media_url:
             try:
                 # Twilio fetch can happen after the original signed URL expires.
                 media_url = supabase.resign_url(str(media_url))
             except Exception as e:
-                print(f"[tasks.py] Warning: failed to re-sign media_url: {e}")
-            twilio_client.messages.create(
-                from_=twilio_from,
-                to=to_number,
-                body=body_text,
-                media_url=[media_url],
-            )
-        else:
-            twilio_client.messages.create(
-                from_=twilio_from,
-                to=to_number,
-                body=body_text,
-            )
+                logger.warning("[tasks.py] failed to re-sign media_url: %s", e)
 
-        ## Save the response to the database
-        supabase.save_message(
+        # Mark the job completed and save the response in one round-trip
+        supabase.finish_job(
+            job_id,
+            {"response": response_text},
             {
                 "phone_number": phone_number,
                 "direction": "out",
                 "role": "assistant",
                 "message_sid": message_sid,
                 "content": db_content,
-            }
+            },
         )
 
+        # Hand the Twilio POST to the reply queue so this worker slot is freed right away
+        logger.debug("[tasks.py] Queueing WhatsApp reply to %s from %s", to_number, twilio_from)
+        send_reply.apply_async((to_number, twilio_from, body_text, media_url), queue=_REPLY_QUEUE)
+
         return {"success": True, "job_id": job_id}
     except Exception as e:
-        supabase.update_job(job_id, {"status": "failed", "error": str(e)})
+        if is_transient_error(e) and self.request.retries < self.max_retries:
+            # Release the job so the retry isn't skipped as a duplicate; Celery re-queues with backoff.
+            supabase.update_job(job_id, {"status": "queued", "error": str(e)})
+            raise
+        supabase.fail_job(job_id, str(e))
         # Try to notify user about failure
         try:
-            to_number = (phone_number or "").strip()
-            if not to_number.lower().startswith("whatsapp:"):
-                to_number = f"whatsapp:{to_number}" if to_number.startswith("+") else f"whatsapp:+{to_number}"
-            twilio_client.messages.create(
-                from_=twilio_from,
-                to=to_number,
-                body="Sorry, your request could not be processed. Please try again later.",
+            send_reply.apply_async(
+                (
+                    _to_whatsapp(phone_number),
+                    twilio_from,
+                    "Sorry, your request could not be processed. Please try again later.",
+                ),
+                queue=_REPLY_QUEUE,
             )
         except Exception:
-            # swallow any Twilio error here; main failure is already recorded
+            # swallow any enqueue error here; main failure is already recorded
             pass
         return {"success": False, "job_id": job_id, "error": str(e)}
+
+
+@celery_app.task(
+    name="send_whatsapp_reply",
+    autoretry_for=(TwilioRestException,),
+    retry_backoff=True,
+    max_retries=5,
+)
+def send_reply(to: str, from_: str, body: str, media_url: str | None = None) -> str:
+    """
+    Send a WhatsApp message via Twilio (retried with backoff independently of the job that produced it).
+    Returns the Twilio message SID.
+    """
+    kwargs: dict[str, Any] = {"from_": from_, "to": to, "body": body}
+    if media_url:
+        kwargs["media_url"] = [media_url]
+    message = _twilio_client().messages.create(**kwargs)
+    logger.debug("[tasks.py] Sent WhatsApp reply to %s: %s", to, message.sid)
+    return message.sid
@@ -2,10 +2,45 @@
 WhatsApp message handler
 """
 
-from typing import Any, Dict, List
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import redis
 
 from services.receipt_processor import RecordProcessor
 from services.call_service import CallService
+from services.semantic_cache import SemanticCache
+from services.openai_client import embedding_cache_info
+
+logger = logging.getLogger(__name__)
+
+# Shared pool for overlapping independent Supabase/OpenAI round-trips (both clients are sync but I/O-bound).
+_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="wbot-handler")
+
+# Model-classified intents keyed by sender + normalized message text. Short replies ("yes", "the second one")
+# depend on conversation context, so they're never cached; longer messages carry their own meaning and are
+# cached whatever the history (which always holds at least the current inbound message once ingested).
+_INTENT_CACHE_MAXSIZE = 5000
+_INTENT_CACHE_TTL_SECONDS = 24 * 60 * 60
+_INTENT_CACHE_MIN_WORDS = 4
+
+
+def _answer_version_key(from_number: str) -> str:
+    return f"wbot:answer_version:{from_number}"
+
+
+def _intent_key(from_number: str, message: str) -> bytes | None:
+    words = (message or "").lower().split()
+    if len(words) < _INTENT_CACHE_MIN_WORDS:
+        return None
+    normalized = f"{from_number}\n{' '.join(words)}"
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).digest()
 
 
 class WhatsAppHandler:
@@ -14,8 +49,23 @@ class WhatsAppHandler:
     def __init__(self, record_processor: RecordProcessor, call_service: CallService | None = None):
         self.processor = record_processor
         self.call_service = call_service
-
-    def handle_media(self, media_urls: List[str], from_number: str, message_sid: str) -> str:
+        # Recent answers per phone, reused for near-duplicate questions ("how much last week" vs
+        # "what did I spend last week") to skip the embedding + RAG + LLM round-trips.
+        self.answer_cache = SemanticCache(
+            threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.85")),
+            ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "300")),
+            max_entries=1000,
+        )
+        # The answer cache lives in each worker process; a per-phone data version in Redis, replaced on
+        # every save, is part of its namespace so a save in one process retires answers in all of them.
+        self.redis_url = (
+            os.getenv("REDIS_URL") or os.getenv("CELERY_BROKER_URL") or "redis://localhost:6379/0"
+        ).strip()
+        self._redis_client: redis.Redis | None = None
+        self._intent_cache: "OrderedDict[bytes, tuple[str, float]]" = OrderedDict()
+        self._intent_lock = threading.Lock()
+
+    def handle_media(self, media_urls: list[str], from_number: str, message_sid: str) -> str:
         """
         Handle media messages (images/PDFs)
 
@@ -27,16 +77,19 @@ class WhatsAppHandler:
         Returns:
             Response message to send back
         """
-        print(f"[WhatsAppHandler] handle_media from={from_number} sid={message_sid} urls={media_urls}")
+        logger.debug("[WhatsAppHandler] handle_media from=%s sid=%s urls=%s", from_number, message_sid, media_urls)
         if not media_urls:
             return "Please send one or more images/PDFs."
+        # Twilio can list the same attachment twice; process each URL once (order preserved)
+        media_urls = list(dict.fromkeys(media_urls))
 
         result = self.processor.process_media_urls(
             media_urls=media_urls, phone_number=from_number, message_sid=message_sid
         )
 
-        print(f"[WhatsAppHandler] handle_media result: {result}")
+        logger.debug("[WhatsAppHandler] handle_media result: %s", result)
         if result.get("success"):
+            self._invalidate_answers(from_number)
             return (
                 f"✅ Saved {result.get('media_count', 1)} file(s) as a record.\nRecord ID: {result.get('record_id')}"
             )
@@ -44,59 +97,158 @@ class WhatsAppHandler:
         error = result.get("error", "Unknown error")
         return f"❌ Failed to process media: {error}"
 
-    def handle_text(self, message: str, from_number: str, message_sid: str = "") -> str | Dict[str, Any]:
+    def handle_text(
+        self, message: str, from_number: str, message_sid: str = "", has_history: bool = True
+    ) -> str | dict[str, Any]:
         """
         Handle text messages (queries)
 
         Args:
             message: Text message content
             from_number: Sender's WhatsApp number
+            has_history: False for a sender with no earlier messages; skips the history read
 
         Returns:
             Response message to send back
         """
-        print(f"[WhatsAppHandler] handle_text from={from_number} sid={message_sid} message='{message[:120]}'")
-        # Fetch recent conversation history (without current message) for better intent + answer
-        history = self.processor.supabase.get_messages_by_phone(phone_number=from_number, limit=10)
-        intent = self.processor.detect_intent(message, history=history)
-        print(f"[WhatsAppHandler] detected intent={intent}")
+        logger.debug(
+            "[WhatsAppHandler] handle_text from=%s sid=%s message='%s'", from_number, message_sid, message[:120]
+        )
+        # Obvious intents are decided by rule; otherwise the answer call classifies as well,
+        # so ambiguous messages cost one LLM round-trip instead of two.
+        intent = self.processor.quick_intent(message)
+        intent_key = None
+        if intent is None:
+            # Same sender sent the same text before and the model classified it: reuse its verdict
+            intent_key = _intent_key(from_number, message)
+            if intent_key is not None:
+                intent = self._cached_intent(intent_key)
+        logger.debug("[WhatsAppHandler] intent=%s (rule/cache)", intent)
+
+        answered = None
+        if intent in (None, "question"):
+            # Read before answering: a save racing this answer replaces the version, so it's never reused
+            answer_namespace = self._answer_namespace(from_number)
+            # Fetch recent conversation history (without current message) while the question is embedded
+            history_future = (
+                _EXECUTOR.submit(self.processor.supabase.get_messages_by_phone, phone_number=from_number, limit=10)
+                if has_history
+                else None
+            )
+            # Embed once: used for the answer cache lookup and reused by the agent's search
+            question_embedding = self.processor.openai.create_embedding(message)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("[WhatsAppHandler] embedding cache: %s", embedding_cache_info())
+            # Only known questions may reuse an answer; an unclassified message could be a note that
+            # merely embeds close to a recent question, and must not be swallowed.
+            if intent == "question" and answer_namespace is not None:
+                cached = self.answer_cache.get(answer_namespace, question_embedding)
+                if cached is not None:
+                    logger.debug("[WhatsAppHandler] answer cache hit for %s", from_number)
+                    return cached
+
+            history = history_future.result() if history_future else []
+            answered = self.processor.answer_question(
+                phone_number=from_number,
+                question=message,
+                history=history,
+                classify=intent is None,
+                question_embedding=question_embedding,
+            )
+            logger.debug("[WhatsAppHandler] answer_question result: %s", answered)
+            if answered.get("success"):
+                intent = answered.get("intent") or "question"
+                if intent_key is not None:
+                    self._remember_intent(intent_key, intent)
+                if intent == "question" and answer_namespace is not None and answered.get("answer"):
+                    self.answer_cache.put(answer_namespace, question_embedding, answered["answer"])
 
         if intent == "save_record":
-            # For text-only notes, we don't have Twilio MessageSid in text handler currently.
-            # We'll save with empty message_sid; app.py can be updated to pass it if desired.
-            saved = self.processor.save_note(phone_number=from_number, message_sid=message_sid, user_text=message)
-            print(f"[WhatsAppHandler] save_note result: {saved}")
-            if saved.get("success"):
-                return f"✅ Saved your note.\nRecord ID: {saved.get('record_id')}"
-            return f"❌ Failed to save your note: {saved.get('error')}"
+            return self._save_note(message=message, from_number=from_number, message_sid=message_sid)
 
         if intent == "call":
-            if not self.call_service:
-                return "❌ Calling is not configured yet."
-
-            extracted = self.processor.extract_call_request(message=message)
-            purpose_of_call = extracted.get("purpose_of_call") or ""
-            target_number = extracted.get("target_number") or ""
-            question_to_ask = extracted.get("question_to_ask") or ""
-            if not target_number or not question_to_ask or not purpose_of_call:
-                return (
-                    "❌ I couldn't parse the call details.\n"
-                    "Try: call +1234567890 and ask if they can share the shipment ETA."
-                )
-
-            started = self.call_service.start_outbound_call(
-                requested_by=from_number,
-                to_number=target_number,
-                prompt_question=question_to_ask,
-                purpose_of_call=purpose_of_call,
-            )
-            print(f"[WhatsAppHandler] start_outbound_call result: {started}")
-            if started.get("success"):
-                return f"📞 Calling {started.get('to_number')} now.\n" f'I\'ll ask: "{question_to_ask}"'
-            return f"❌ Failed to start call: {started.get('error')}"
+            return self._start_call(message=message, from_number=from_number)
 
-        answered = self.processor.answer_question(phone_number=from_number, question=message, history=history)
-        print(f"[WhatsAppHandler] answer_question result: {answered}")
         if answered.get("success"):
             return answered.get("answer", "I couldn't generate an answer.")
         return f"❌ Failed to answer: {answered.get('error')}"
+
+    def _cached_intent(self, key: bytes) -> str | None:
+        with self._intent_lock:
+            entry = self._intent_cache.get(key)
+            if entry is None:
+                return None
+            intent, stored_at = entry
+            if time.monotonic() - stored_at >= _INTENT_CACHE_TTL_SECONDS:
+                del self._intent_cache[key]
+                return None
+            self._intent_cache.move_to_end(key)
+            return intent
+
+    def _remember_intent(self, key: bytes, intent: str) -> None:
+        with self._intent_lock:
+            self._intent_cache[key] = (intent, time.monotonic())
+            self._intent_cache.move_to_end(key)
+            while len(self._intent_cache) > _INTENT_CACHE_MAXSIZE:
+                self._intent_cache.popitem(last=False)
+
+    def _redis(self) -> redis.Redis:
+        if self._redis_client is None:
+            self._redis_client = redis.Redis.from_url(self.redis_url)
+        return self._redis_client
+
+    def _answer_namespace(self, from_number: str) -> str | None:
+        """Answer cache namespace for the sender's current data version, or None to bypass the cache."""
+        try:
+            version = self._redis().get(_answer_version_key(from_number))
+        except redis.RedisError as e:
+            # Without the shared version a cached answer may predate a save made in another process
+            logger.warning("[WhatsAppHandler] answer version read failed, skipping answer cache: %s", e)
+            return None
+        return f"{from_number}:{int(version or 0)}"
+
+    def _invalidate_answers(self, from_number: str) -> None:
+        """Retire cached answers for the sender in every worker process."""
+        try:
+            # A fresh, never-reused version; once it expires every entry cached before it has expired too
+            self._redis().set(
+                _answer_version_key(from_number), time.time_ns(), ex=int(self.answer_cache.ttl_seconds) + 1
+            )
+        except redis.RedisError as e:
+            logger.warning("[WhatsAppHandler] answer version update failed: %s", e)
+
+    def _save_note(self, message: str, from_number: str, message_sid: str) -> str:
+        # For text-only notes, we don't have Twilio MessageSid in text handler currently.
+        # We'll save with empty message_sid; app.py can be updated to pass it if desired.
+        saved = self.processor.save_note(phone_number=from_number, message_sid=message_sid, user_text=message)
+        logger.debug("[WhatsAppHandler] save_note result: %s", saved)
+        if saved.get("success"):
+            # New data: cached answers for this user may now be stale
+            self._invalidate_answers(from_number)
+            return f"✅ Saved your note.\nRecord ID: {saved.get('record_id')}"
+        return f"❌ Failed to save your note: {saved.get('error')}"
+
+    def _start_call(self, message: str, from_number: str) -> str:
+        if not self.call_service:
+            return "❌ Calling is not configured yet."
+
+        extracted = self.processor.extract_call_request(message=message)
+        purpose_of_call = extracted.get("purpose_of_call") or ""
+        target_number = extracted.get("target_number") or ""
+        question_to_ask = extracted.get("question_to_ask") or ""
+        if not target_number or not question_to_ask or not purpose_of_call:
+            return (
+                "❌ I couldn't parse the call details.\n"
+                "Try: call +1234567890 and ask if they can share the shipment ETA."
+            )
+
+        started = self.call_service.start_outbound_call(
+            requested_by=from_number,
+            to_number=target_number,
+            prompt_question=question_to_ask,
+            purpose_of_call=purpose_of_call,
+        )
+        logger.debug("[WhatsAppHandler] start_outbound_call result: %s", started)
+        if started.get("success"):
+            return f"📞 Calling {started.get('to_number')} now.\n" f'I\'ll ask: "{question_to_ask}"'
+        return f"❌ Failed to start call: {started.get('error')}"
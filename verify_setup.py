@@ -42,15 +42,22 @@ def check_imports():
             print(f"❌ {name} is not installed")
             all_ok = False
 
-    # Check pdf2image (includes Pillow as dependency)
+    # Check PDF rendering: pypdfium2 (preferred) or pdf2image fallback (both need Pillow)
     try:
-        import pdf2image
+        import pypdfium2
         from PIL import Image
 
-        print(f"✅ pdf2image is installed (PDF support enabled)")
-        print(f"✅ Pillow is installed (via pdf2image dependency)")
+        print(f"✅ pypdfium2 is installed (PDF support enabled)")
+        print(f"✅ Pillow is installed")
     except ImportError:
-        print(f"⚠️  pdf2image is not installed (PDF support disabled)")
+        try:
+            import pdf2image
+            from PIL import Image
+
+            print(f"✅ pdf2image is installed (PDF support enabled via poppler fallback)")
+            print(f"✅ Pillow is installed (via pdf2image dependency)")
+        except ImportError:
+            print(f"⚠️  pypdfium2/pdf2image are not installed (PDF support disabled)")
 
     return all_ok
 